@@ -0,0 +1,100 @@
+"""Compare the streaming gogData extractor with the previous DOTALL regex
+
+Usage:
+    python benchmarks/bench_extract.py [PAGE.html ...]
+
+Pages saved with `gog-price-checker -w USER --dump-html DIR` can be passed as
+fixtures. Without arguments a synthetic wishlist page is generated.
+"""
+import os
+import re
+import sys
+import json
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from gog_price_checker.__main__ import extract_gog_data, extract_gog_data_stream  # noqa: E402
+
+
+def legacy_extract_gog_data(html_content):
+    """extract_gog_data as it was before the streaming extractor"""
+    match = re.search(r'window\.gogData\s*=\s*(\{.*?\});\s*window\.', html_content, re.DOTALL)
+    if match:
+        return json.loads(match.group(1))
+    match = re.search(r'var gogData\s*=\s*(\{.*?\});\s*', html_content, re.DOTALL)
+    if match:
+        return json.loads(match.group(1))
+    return None
+
+
+def synthetic_page(products=500, padding=1000000):
+    gog_data = {
+        "products": [{
+            "id": 1000000 + i,
+            "title": f"Game {i}",
+            "url": f"/game/game_{i}",
+            "price": {"amount": f"{i % 50 + 0.99:.2f}", "currency": "USD"},
+            "genres": ["Action", "RPG"],
+        } for i in range(products)],
+    }
+    head = "<html><head>" + "<meta name='x' content='y'>" * (padding // 40) + "</head><body><script>"
+    tail = "</script>" + "<div class='row'>filler</div>" * (padding // 30) + "</body></html>"
+    return head + "window.gogData = " + json.dumps(gog_data) + ";\n    window.activeFeatures = [];" + tail
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def consumed_bytes(byte_chunks):
+    """Bytes the streaming extractor reads before it stops"""
+    consumed = 0
+
+    def counted():
+        nonlocal consumed
+        for chunk in byte_chunks:
+            consumed += len(chunk)
+            yield chunk
+
+    extract_gog_data_stream(counted())
+    return consumed
+
+
+def bench(name, html, number):
+    raw = html.encode('utf-8')
+    expected = extract_gog_data(html)
+    byte_chunks = chunked(raw, 64 * 1024)
+    cases = [
+        ("legacy regex", lambda: legacy_extract_gog_data(html)),
+        ("scanner (str)", lambda: extract_gog_data(html)),
+        ("scanner (64 KiB byte chunks)", lambda: extract_gog_data_stream(byte_chunks)),
+    ]
+    print(f"{name}: {len(raw)} bytes, streaming reads {consumed_bytes(byte_chunks)} bytes")
+    for label, fn in cases:
+        try:
+            correct = fn() == expected
+        except ValueError:
+            correct = False
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number if correct else 0
+        status = f"{best * 1000:8.3f} ms" if correct else "  failed to extract gogData"
+        print(f"  {label:<30} {status}")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", help="saved wishlist HTML pages")
+    parser.add_argument("-n", "--number", type=int, default=20, help="runs per measurement")
+    args = parser.parse_args()
+
+    if args.pages:
+        for page in args.pages:
+            with open(page, encoding='utf-8') as f:
+                bench(page, f.read(), args.number)
+    else:
+        bench("synthetic page", synthetic_page(), args.number)
+
+
+if __name__ == "__main__":
+    main()
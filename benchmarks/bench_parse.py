@@ -0,0 +1,89 @@
+"""Compare parse_price_body with the previous decode + json.loads + split path
+
+Usage:
+    python benchmarks/bench_parse.py [RESPONSE.json ...]
+
+Recorded /products/{id}/prices responses can be passed as fixtures. Without
+arguments a response shaped like the real one is generated for a local
+currency and for USD.
+"""
+import os
+import sys
+import json
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from gog_price_checker.__main__ import json_loads, parse_price_body  # noqa: E402
+
+
+def legacy_parse_price_body(body):
+    """The parsing request_price did before parse_price_body"""
+    data = json.loads(body.decode('utf-8'))
+    value = currency = value_usd = None
+    for i, item in enumerate(data['_embedded']['prices']):
+        if i == 0:
+            final_price = item['finalPrice'].split(" ")
+            value = int(final_price[0]) / 100
+            currency = final_price[1]
+        if item['currency']['code'] == "USD":
+            value_usd = int(item['finalPrice'].split(" ")[0]) / 100
+    return value, currency, value_usd
+
+
+def synthetic_response(currency='PLN', product_id=1207658930):
+    def price(code, cents):
+        return {
+            "currency": {"code": code},
+            "basePrice": f"{cents * 2} {code}",
+            "finalPrice": f"{cents} {code}",
+            "bonusWalletFunds": f"0 {code}",
+        }
+
+    return json.dumps({
+        "_links": {"self": {"href": f"https://api.gog.com/products/{product_id}/prices?countryCode=PL"}},
+        "_embedded": {
+            "prices": [price(currency, 4499), price("USD", 1199)],
+            "product": {
+                "id": product_id,
+                "_links": {"self": {"href": f"https://api.gog.com/products/{product_id}"}},
+            },
+        },
+    }).encode('utf-8')
+
+
+def bench(name, body, number):
+    expected = legacy_parse_price_body(body)
+    cases = [
+        ("decode + json.loads + split", lambda: legacy_parse_price_body(body)),
+        ("parse_price_body", lambda: parse_price_body(body)),
+    ]
+    print(f"{name}: {len(body)} bytes, JSON backend {json_loads.__module__}")
+    baseline = None
+    for label, fn in cases:
+        if fn() != expected:
+            print(f"  {label:<30} returned {fn()!r} instead of {expected!r}")
+            continue
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        baseline = baseline or best
+        print(f"  {label:<30} {best * 1e6:8.2f} us  {baseline / best:5.1f}x")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("responses", nargs="*", help="recorded price responses")
+    parser.add_argument("-n", "--number", type=int, default=20000, help="runs per measurement")
+    args = parser.parse_args()
+
+    if args.responses:
+        for path in args.responses:
+            with open(path, 'rb') as f:
+                bench(path, f.read(), args.number)
+    else:
+        bench("synthetic PLN response", synthetic_response('PLN'), args.number)
+        bench("synthetic USD response", synthetic_response('USD'), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""End-to-end benchmark of the fetch/parse pipeline against a local GOG stand-in
+
+Usage:
+    python benchmarks/bench_pipeline.py [--products 20] [--latency 0.02] [--output run.json]
+    python benchmarks/bench_pipeline.py --compare baseline.json
+
+Starts benchmarks/fake_gog.py in a subprocess and runs every scenario
+(request_prices, process_wishlist, extract_gog_data) in a fresh interpreter,
+so peak RSS and thread counts belong to that scenario alone. Reports wall
+time, throughput, peak RSS and peak thread count; --output saves the results
+as JSON and --compare flags scenarios slower than a saved run.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+import subprocess
+from argparse import ArgumentParser
+from urllib.request import urlopen
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, os.pardir))
+
+import gog_price_checker.__main__ as checker  # noqa: E402
+
+SCENARIOS = ('request_prices', 'process_wishlist', 'extract_gog_data')
+# Slowdown in wall time reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+class ThreadSampler(threading.Thread):
+    """Tracks the highest number of other live threads while running"""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def server_stats(base_url):
+    with urlopen(f"{base_url}/_stats") as response:
+        return json.loads(response.read())
+
+
+def run_scenario(name, base_url, args):
+    """Run one scenario in this process and return its measurements"""
+    checker.set_transport(checker.Transport(
+        host_map={'api.gog.com': base_url, 'www.gog.com': base_url},
+        limiter=checker.RateLimiter(args.rate, max_inflight=args.workers)))
+    # Fixed rates keep the exchange rate API out of the measurement
+    checker.set_fx(checker.FxRates({'EUR': 0.92, 'GBP': 0.79, 'PLN': 3.95, 'CNY': 7.2, 'BRL': 5.0, 'RUB': 90.0}))
+    metrics = checker.Metrics()
+    checker.set_metrics(metrics)
+    before = server_stats(base_url)
+    sampler = ThreadSampler()
+    sampler.start()
+    started = time.perf_counter()
+
+    if name == 'request_prices':
+        items = args.products
+        with checker.FetchEngine(args.workers, args.per_host) as engine:
+            for _ in checker.iter_prices(range(1000, 1000 + args.products), engine=engine):
+                pass
+    elif name == 'process_wishlist':
+        items = len(checker.COUNTRIES)
+        with checker.FetchEngine(args.workers, args.per_host) as engine:
+            checker.process_wishlist('benchmark', engine=engine)
+    else:
+        html = checker.fetch_wishlist('benchmark', 'US')
+        items = args.number
+        for _ in range(args.number):
+            checker.extract_gog_data(html)
+
+    wall_time = time.perf_counter() - started
+    threads = sampler.stop()
+    after = server_stats(base_url)
+    requests = after['requests'] - before['requests'] - (1 if name == 'extract_gog_data' else 0)
+    return {
+        'wall_time': wall_time,
+        'items': items,
+        'items_per_second': items / wall_time,
+        'requests': requests,
+        'requests_per_second': requests / wall_time,
+        'errors': after['errors'] - before['errors'],
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+        'peak_threads': threads,
+        'phases': metrics.phases(),
+    }
+
+
+def start_server(args):
+    command = [sys.executable, os.path.join(BENCH_DIR, 'fake_gog.py'), '--latency', str(args.latency),
+               '--jitter', str(args.jitter), '--error-rate', str(args.error_rate),
+               '--wishlist-products', str(args.wishlist_products), '--seed', '0']
+    if args.fixtures:
+        command += ['--fixtures', args.fixtures]
+    if args.no_wishlist_api:
+        command.append('--no-wishlist-api')
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    return server, server.stdout.readline().strip()
+
+
+def child_command(name, base_url, args):
+    command = [sys.executable, os.path.abspath(__file__), '--run', name, '--server', base_url]
+    for option in ('products', 'workers', 'per_host', 'rate', 'number'):
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    return command
+
+
+def compare(results, baseline_path):
+    """Print the change against a saved run; True if any scenario regressed"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['scenarios']
+    regressed = False
+    print(f"\nCompared with {baseline_path}:")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result['wall_time'] / baseline[name]['wall_time'] - 1
+        status = "REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        regressed = regressed or bool(status)
+        print(f"  {name:<18} {change * 100:+7.1f}% wall time, "
+              f"{result['peak_rss_kib'] - baseline[name]['peak_rss_kib']:+8d} KiB peak RSS  {status}")
+    return regressed
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--products", type=int, default=20, help="products checked by request_prices")
+    parser.add_argument("--wishlist-products", type=int, default=100, help="products in the generated wishlist")
+    parser.add_argument("--number", type=int, default=20, help="extract_gog_data runs")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stand-in takes per response")
+    parser.add_argument("--jitter", type=float, default=0.01, help="random +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses failing with 503")
+    parser.add_argument("--fixtures", help="directory of recorded responses, see fake_gog.py")
+    parser.add_argument("--no-wishlist-api", action="store_true", help="make process_wishlist scrape HTML pages")
+    parser.add_argument("-j", "--workers", type=int, default=checker.MAX_WORKERS)
+    parser.add_argument("--per-host", type=int, default=checker.MAX_CONNECTIONS_PER_HOST)
+    parser.add_argument("--rate", type=float, default=100000,
+                        help="client rate limit in requests/s (default: effectively unlimited)")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--run", choices=SCENARIOS, help="internal: run one scenario and print its JSON")
+    parser.add_argument("--server", help="internal: base url of the running stand-in")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.run:
+        # Expected fallbacks and injected errors would drown the report
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(run_scenario(args.run, args.server, args)))
+        return
+
+    server, base_url = start_server(args)
+    results = {}
+    try:
+        print(f"{'Scenario':<18} {'Wall s':>8} {'Items/s':>9} {'Req/s':>9} {'Errors':>7} {'RSS KiB':>9} {'Threads':>8}")
+        for name in args.scenarios or SCENARIOS:
+            output = subprocess.run(child_command(name, base_url, args), stdout=subprocess.PIPE,
+                                    universal_newlines=True, check=True).stdout
+            result = results[name] = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<18} {result['wall_time']:>8.3f} {result['items_per_second']:>9.1f} "
+                  f"{result['requests_per_second']:>9.1f} {result['errors']:>7} {result['peak_rss_kib']:>9} "
+                  f"{result['peak_threads']:>8}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'created': time.time(), 'python': sys.version.split()[0],
+                       'settings': {key: value for key, value in vars(args).items()
+                                    if key not in ('output', 'compare', 'run', 'server')},
+                       'scenarios': results}, f, indent=2)
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Local stand-in for the GOG endpoints the checker talks to
+
+Usage:
+    python benchmarks/fake_gog.py [--port 8000] [--latency 0.05] [--jitter 0.02] [--error-rate 0.01]
+
+Serves /products/{id}/prices, the multi-product /products/prices?ids=...,
+/u/{user}/wishlist (HTML with gogData), /u/{user}/wishlist/search and
+/game/{slug}. Responses come from a fixtures
+directory when one is given, otherwise they are generated:
+
+    FIXTURES/prices/{product_id}_{COUNTRY}.json   price response for one country
+    FIXTURES/prices/{product_id}.json             price response for every country
+    FIXTURES/wishlist/{COUNTRY}.html              wishlist page for one country
+    FIXTURES/wishlist.html                        wishlist page for every country
+
+Pages saved with `gog-price-checker -w USER --dump-html DIR` can be used as
+wishlist fixtures. GET /_stats returns the request counters as JSON.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs
+
+# Currency and price multiplier of the generated price regions
+REGIONS = {
+    'EUR': ('AD', 'AT', 'BE', 'CY', 'DE', 'EE', 'ES', 'FI', 'FR', 'GR', 'IE', 'IT', 'LT', 'LU', 'LV',
+            'MC', 'ME', 'MT', 'NL', 'PT', 'SI', 'SK', 'SM', 'VA'),
+    'GBP': ('GB',),
+    'PLN': ('PL',),
+    'CNY': ('CN',),
+    'BRL': ('BR',),
+    'RUB': ('RU', 'BY'),
+}
+RATES = {'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'PLN': 3.95, 'CNY': 7.2, 'BRL': 5.0, 'RUB': 90.0}
+WISHLIST_PAGE_SIZE = 50
+
+
+def country_currency(country_code):
+    for currency, members in REGIONS.items():
+        if country_code in members:
+            return currency
+    return 'USD'
+
+
+def generated_price(product_id, country_code):
+    """A price response shaped like api.gog.com/products/{id}/prices"""
+    currency = country_currency(country_code)
+    # Regional discounts vary by the first letter, so USD countries form a few regions
+    cents_usd = 499 + int(product_id) % 50 * 100 - (ord(country_code[0]) % 4) * 50
+    prices = [{'currency': {'code': currency},
+               'basePrice': f"{round(cents_usd * RATES[currency])} {currency}",
+               'finalPrice': f"{round(cents_usd * RATES[currency])} {currency}"}]
+    if currency != 'USD':
+        prices.append({'currency': {'code': 'USD'},
+                       'basePrice': f"{cents_usd} USD", 'finalPrice': f"{cents_usd} USD"})
+    return {'_embedded': {'prices': prices}}
+
+
+def generated_wishlist(country_code, products):
+    currency = country_currency(country_code)
+    return [{'id': 1000000 + i, 'title': f"Game {i}", 'url': f"/game/game_{i}",
+             'price': {'amount': f"{(499 + i % 50 * 100) * RATES[currency] / 100:.2f}", 'currency': currency}}
+            for i in range(products)]
+
+
+def wishlist_page(products, padding=200000):
+    gog_data = json.dumps({'products': products})
+    return ("<html><head>" + "<meta name='x' content='y'>" * (padding // 40) + "</head><body><script>"
+            "window.gogData = " + gog_data + ";\n    window.activeFeatures = [];</script>"
+            + "<div class='row'>filler</div>" * (padding // 30) + "</body></html>")
+
+
+class FakeGog(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), fixtures=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 wishlist_products=100, wishlist_api=True, seed=None):
+        super().__init__(address, FakeGogHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.wishlist_products = wishlist_products
+        self.wishlist_api = wishlist_api
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'errors': 0, 'bytes': 0}
+        self.lock = threading.Lock()
+        self._fixture_cache = {}
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def fixture(self, *candidates):
+        """Contents of the first existing fixture file, or None"""
+        if not self.fixtures:
+            return None
+        for candidate in candidates:
+            if candidate not in self._fixture_cache:
+                path = os.path.join(self.fixtures, candidate)
+                try:
+                    with open(path, 'rb') as f:
+                        self._fixture_cache[candidate] = f.read()
+                except OSError:
+                    self._fixture_cache[candidate] = None
+            if self._fixture_cache[candidate] is not None:
+                return self._fixture_cache[candidate]
+        return None
+
+    def handle_error(self, request, client_address):
+        # The checker drops a wishlist connection once gogData is read, that is not an error
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def delay(self):
+        with self.lock:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            failed = self.random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+
+class FakeGogHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle would hold the body back for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == '/_stats':
+            with server.lock:
+                return self.send(200, json.dumps(server.stats), count=False)
+        if server.delay():
+            with server.lock:
+                server.stats['errors'] += 1
+            return self.send(503, '{"error": "injected"}')
+
+        match = re.match(r'/products/(\d+)/prices$', parts.path)
+        if match:
+            product_id = match.group(1)
+            country_code = query.get('countryCode', ['US'])[0]
+            body = server.fixture(os.path.join('prices', f"{product_id}_{country_code}.json"),
+                                  os.path.join('prices', f"{product_id}.json"))
+            return self.send(200, body or json.dumps(generated_price(product_id, country_code)))
+        if parts.path == '/products/prices':
+            country_code = query.get('countryCode', ['US'])[0]
+            items = []
+            for product_id in query.get('ids', [''])[0].split(','):
+                body = server.fixture(os.path.join('prices', f"{product_id}_{country_code}.json"),
+                                      os.path.join('prices', f"{product_id}.json"))
+                prices = json.loads(body) if body else generated_price(product_id, country_code)
+                items.append({'_embedded': {'product': {'id': int(product_id)},
+                                            'prices': prices['_embedded']['prices']}})
+            return self.send(200, json.dumps({'_embedded': {'items': items}}))
+
+        if parts.path.startswith('/game/'):
+            return self.send(200, '<html><div card-product="1207658930"></div></html>', 'text/html')
+
+        match = re.search(r'gog_lc=(\w\w)_', self.headers.get('Cookie') or '')
+        country_code = match.group(1) if match else 'US'
+        if parts.path.endswith('/wishlist/search'):
+            if not server.wishlist_api or server.fixture('wishlist.html', os.path.join('wishlist', f"{country_code}.html")):
+                # Recorded pages only exist as HTML, make the checker scrape them
+                return self.send(404, '{}')
+            page = int(query.get('page', ['1'])[0])
+            products = generated_wishlist(country_code, server.wishlist_products)
+            total_pages = max((len(products) + WISHLIST_PAGE_SIZE - 1) // WISHLIST_PAGE_SIZE, 1)
+            start = (page - 1) * WISHLIST_PAGE_SIZE
+            return self.send(200, json.dumps({'page': page, 'totalPages': total_pages,
+                                              'totalProducts': len(products),
+                                              'products': products[start:start + WISHLIST_PAGE_SIZE]}))
+        if parts.path.endswith('/wishlist'):
+            body = server.fixture(os.path.join('wishlist', f"{country_code}.html"), 'wishlist.html')
+            return self.send(200, body or wishlist_page(generated_wishlist(country_code, server.wishlist_products)),
+                             'text/html')
+        return self.send(404, '{}')
+
+    def send(self, status, body, content_type='application/json', count=True):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if count:
+            with self.server.lock:
+                self.server.stats['requests'] += 1
+                self.server.stats['bytes'] += len(body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="port to listen on (default: any free port)")
+    parser.add_argument("--fixtures", help="directory of recorded responses")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--wishlist-products", type=int, default=100, help="products in generated wishlists")
+    parser.add_argument("--no-wishlist-api", action="store_true",
+                        help="answer the wishlist JSON listing with 404 so the HTML page is scraped")
+    parser.add_argument("--seed", type=int, help="seed for latency jitter and errors")
+    args = parser.parse_args()
+
+    server = FakeGog((args.host, args.port), args.fixtures, args.latency, args.jitter, args.error_rate,
+                     args.wishlist_products, not args.no_wishlist_api, args.seed)
+    # The first line tells a parent process where to connect
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,127 @@
 import re
+import sys
 import json
+import zlib
+import mmap
+import math
+from array import array
+from bisect import bisect_left
+from heapq import nsmallest
+import random
 import logging
-from threading import Thread
+import codecs
+import socket
+import sqlite3
+import http.client
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Condition, Lock, local
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from argparse import ArgumentParser
 from urllib import request as urllib_request
+from urllib.error import HTTPError
 import os
-import tempfile
+import time
+from urllib.parse import parse_qs, urljoin, urlsplit
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+try:
+    # Optional (pip install gog-price-checker[fast]), decodes JSON bytes several times faster
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    # Serializes price history writers across processes; not available on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Upper bound on concurrent requests shared by all products in one run
+MAX_WORKERS = 16
+# Upper bound on concurrent requests to a single host
+MAX_CONNECTIONS_PER_HOST = 8
+# Seconds to wait for a single HTTP response
+REQUEST_TIMEOUT = 30
+# Sustained requests per second across all fetch paths, adapted down on HTTP 429
+RATE_LIMIT = 50
+# Responses slower than this many seconds count as a sign of an overloaded API
+SLOW_LATENCY = 5
+# Retries of a failed request, with exponential backoff and jitter starting from RETRY_BASE_DELAY seconds
+RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Redirects are followed like urlopen does, up to MAX_REDIRECTS hops
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+# Consecutive failures after which a country is skipped for CIRCUIT_COOLDOWN seconds
+CIRCUIT_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30
+# Most recent durations per phase kept for the --profile percentiles
+METRICS_SAMPLES = 10000
+# Bytes read per step when streaming a response body
+STREAM_CHUNK_SIZE = 64 * 1024
+# Where the on-disk cache lives
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'gog_price_checker')
+# Where the price history lives
+HISTORY_DIR = os.path.join(os.path.expanduser('~'), '.local', 'share', 'gog_price_checker', 'history')
+# Seconds a cached price response is used without asking the API again
+CACHE_TTL = 60 * 60
+# Cached price responses kept before the least recently used are evicted
+CACHE_MAX_ENTRIES = 100000
+# Exchange rates against USD, refreshed once the cached snapshot is FX_TTL seconds old
+FX_RATES_URL = 'https://open.er-api.com/v6/latest/USD'
+FX_TTL = 24 * 60 * 60
+# Game slugs remembered before the least recently used are evicted
+SLUG_MAX_ENTRIES = 50000
+# Products fully checked before learned price regions are trusted, and how often
+# (every Nth product) all countries are checked again to detect regions that diverged
+REGION_MIN_SAMPLES = 3
+REGION_VERIFY_EVERY = 25
+# Seconds the serve mode keeps results in memory
+SERVE_CACHE_TTL = 60
+# Results the serve mode keeps in memory before dropping the least recently used
+SERVE_CACHE_MAX_ENTRIES = 1024
+# Seconds between two polls of a watched product, and the bounds it adapts within
+WATCH_INTERVAL = 60 * 60
+WATCH_MIN_INTERVAL = 10 * 60
+WATCH_MAX_INTERVAL = 24 * 60 * 60
+# Seconds between redraws of the --live ranking
+LIVE_INTERVAL = 0.1
+# Most product ids asked for in one multi-product price request
+BULK_PRICE_IDS = 50
+# Country whose wishlist listing tells which products to price
+WISHLIST_COUNTRY = 'US'
+# Paged JSON listing behind the public wishlist page
+WISHLIST_API_URL = 'https://www.gog.com/u/{username}/wishlist/search?page={page}'
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
 
 
 class Price:
-    country_code = None
-    country_name = None
-    currency = None
-    value = None
-    value_usd = None
+    """Price of one product in one country, owned by the check that created it
+
+    missing is set when the country did not answer before the deadline.
+    """
+    __slots__ = ('country_code', 'country_name', 'currency', 'value', 'value_usd', 'missing')
 
-    def __init__(self, country_code, country_name):
+    def __init__(self, country_code, country_name, missing=False):
         self.country_name = country_name
         self.country_code = country_code
+        self.currency = None
+        self.value = None
+        self.value_usd = None
+        self.missing = missing
+
+    def __repr__(self):
+        return f"Price({self.country_code}, {self.value} {self.currency}, {self.value_usd} USD)"
 
 
 COUNTRIES = {
@@ -105,8 +209,6 @@ COUNTRIES = {
     "ZA": "South Africa",
     "AE": "United Arab Emirates"}
 
-COUNTRY_PRICES = [Price(key, value) for key, value in COUNTRIES.items()]
-
 def setup_logging(verbose=False):
     level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(
@@ -115,227 +217,2432 @@ def setup_logging(verbose=False):
     )
 
 
+class Response:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self, encoding='utf-8'):
+        return self.body.decode(encoding)
+
+
+def decode_body(body, content_encoding):
+    """Undo gzip/deflate content encoding of a response body"""
+    content_encoding = (content_encoding or '').lower()
+    if content_encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate streams without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def percentile(values, percent):
+    """Linearly interpolated percentile of an already sorted, non-empty sequence"""
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Metrics:
+    """Durations per phase and event counters, for --profile and /metrics
+
+    Phases are timed spans such as dns, tcp, tls, wait, transfer, parse,
+    request, wishlist and extract; a country can be attached to find the
+    slowest ones. Percentiles are computed over the last `samples` durations
+    of each phase, counts and sums over the whole run.
+    """
+
+    def __init__(self, samples=METRICS_SAMPLES):
+        self.samples = samples
+        self._durations = {}
+        self._totals = {}
+        self._countries = {}
+        self._events = {}
+        self._lock = Lock()
+
+    def observe(self, phase, seconds, country=None):
+        with self._lock:
+            durations = self._durations.get(phase)
+            if durations is None:
+                durations = self._durations[phase] = deque(maxlen=self.samples)
+            durations.append(seconds)
+            totals = self._totals.setdefault(phase, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            if country:
+                totals = self._countries.setdefault((phase, country), [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+
+    def count(self, event, amount=1):
+        with self._lock:
+            self._events[event] = self._events.get(event, 0) + amount
+
+    def phases(self, percentiles=(50, 95, 99)):
+        """{phase: {'count', 'sum', 'p50', ...}} with durations in seconds"""
+        with self._lock:
+            snapshot = {phase: (sorted(durations), self._totals[phase])
+                        for phase, durations in self._durations.items()}
+        result = {}
+        for phase, (durations, (count, total)) in snapshot.items():
+            stats = {'count': count, 'sum': total}
+            for percent in percentiles:
+                stats[f'p{percent:g}'] = percentile(durations, percent)
+            result[phase] = stats
+        return result
+
+    def slowest_countries(self, phase='request', count=5):
+        """[(country, mean seconds, requests)] of the countries slowest on average"""
+        with self._lock:
+            means = [(country, total / n, n) for (name, country), (n, total) in self._countries.items()
+                     if name == phase]
+        return sorted(means, key=lambda item: item[1], reverse=True)[:count]
+
+    def events(self):
+        with self._lock:
+            return dict(self._events)
+
+    def summary(self):
+        """Human readable timing report"""
+        lines = [f"{'Phase':<10} {'Count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Total s':>9}"]
+        for phase, stats in sorted(self.phases().items(), key=lambda item: item[1]['sum'], reverse=True):
+            lines.append(f"{phase:<10} {stats['count']:>8} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} "
+                         f"{stats['p99'] * 1000:>9.1f} {stats['sum']:>9.2f}")
+        for phase in ('request', 'wishlist'):
+            slowest = self.slowest_countries(phase)
+            if slowest:
+                lines.append(f"Slowest countries ({phase}):")
+                for country, mean, n in slowest:
+                    lines.append(f"  {COUNTRIES.get(country, country):<25} {mean * 1000:>9.1f} ms over {n}")
+        events = self.events()
+        if events:
+            lines.append("Events: " + ", ".join(f"{event}={n}" for event, n in sorted(events.items())))
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = ["# HELP gog_price_checker_phase_seconds Time spent per phase.",
+                 "# TYPE gog_price_checker_phase_seconds summary"]
+        for phase, stats in sorted(self.phases().items()):
+            for percent in (50, 95, 99):
+                lines.append(f'gog_price_checker_phase_seconds{{phase="{phase}",quantile="{percent / 100:g}"}} '
+                             f'{stats[f"p{percent}"]:.6f}')
+            lines.append(f'gog_price_checker_phase_seconds_sum{{phase="{phase}"}} {stats["sum"]:.6f}')
+            lines.append(f'gog_price_checker_phase_seconds_count{{phase="{phase}"}} {stats["count"]}')
+        with self._lock:
+            countries = sorted(self._countries.items())
+        lines += ["# HELP gog_price_checker_country_seconds Time spent per phase and country.",
+                  "# TYPE gog_price_checker_country_seconds summary"]
+        for (phase, country), (n, total) in countries:
+            labels = f'phase="{phase}",country="{country}"'
+            lines.append(f'gog_price_checker_country_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'gog_price_checker_country_seconds_count{{{labels}}} {n}')
+        lines += ["# HELP gog_price_checker_events_total Cache lookups, retries and other events.",
+                  "# TYPE gog_price_checker_events_total counter"]
+        for event, n in sorted(self.events().items()):
+            lines.append(f'gog_price_checker_events_total{{event="{event}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+
+
+def get_metrics():
+    """Return the process-wide Metrics, or None when nothing is measured"""
+    return _metrics
+
+
+def set_metrics(metrics):
+    global _metrics
+    _metrics = metrics
+
+
+@contextmanager
+def timed(phase, country=None):
+    """Record the duration of the block as phase, if metrics are collected"""
+    metrics = _metrics
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(phase, time.perf_counter() - started, country)
+
+
+def count_event(event):
+    metrics = _metrics
+    if metrics is not None:
+        metrics.count(event)
+
+
+# When the socket of the connection being opened by this thread was connected, to time TLS apart
+_connecting = local()
+
+
+def timed_create_connection(address, timeout=None, source_address=None):
+    """socket.create_connection recording name resolution and TCP connect times"""
+    host, port = address
+    with timed('dns'):
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    error = OSError(f"no address found for {host}")
+    with timed('tcp'):
+        for family, socket_type, protocol, _, socket_address in addresses:
+            sock = socket.socket(family, socket_type, protocol)
+            try:
+                sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(socket_address)
+                break
+            except OSError as e:
+                sock.close()
+                error = e
+        else:
+            raise error
+    _connecting.connected = time.perf_counter()
+    return sock
+
+
+class RateLimiter:
+    """Token bucket shared by every request, adapting to how the API copes
+
+    Besides the request rate it caps the number of requests in flight. A 429
+    halves both, a slow response shrinks the cap a little and fast successes
+    grow them back slowly (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=None, max_inflight=MAX_WORKERS,
+                 min_rate=1.0, slow_latency=SLOW_LATENCY):
+        self.max_rate = self.rate = float(rate)
+        self.min_rate = min(min_rate, self.rate)
+        self.capacity = float(burst or 2 * rate)
+        self.max_inflight = self.limit = float(max_inflight)
+        self.slow_latency = slow_latency
+        self.inflight = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._condition = Condition()
+
+    def acquire(self, deadline=None):
+        """Wait for a slot; False if deadline (a time.monotonic() value) passes first"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.inflight < max(int(self.limit), 1) and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.inflight += 1
+                    return True
+                if deadline is not None and now >= deadline:
+                    return False
+                # Wait for a token to refill, or for a request in flight to finish
+                timeout = (1 - self._tokens) / self.rate if self._tokens < 1 else None
+                if deadline is not None:
+                    timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+                self._condition.wait(timeout)
+
+    def release(self):
+        with self._condition:
+            self.inflight -= 1
+            self._condition.notify()
+
+    def throttled(self):
+        with self._condition:
+            self.rate = max(self.rate / 2, self.min_rate)
+            self.limit = max(self.limit / 2, 1)
+        logging.warning(f"Throttled by the API, slowing down to {self.rate:.1f} requests/s")
+
+    def succeeded(self, latency):
+        with self._condition:
+            if latency > self.slow_latency:
+                self.limit = max(self.limit * 0.9, 1)
+            else:
+                self.rate = min(self.rate + 1 / self.rate, self.max_rate)
+                self.limit = min(self.limit + 1 / self.limit, self.max_inflight)
+            self._condition.notify_all()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def out_of_time(deadline):
+    """True once deadline, a time.monotonic() value or None for no deadline, has passed"""
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class CircuitBreaker:
+    """Fails requests for a key (e.g. a country) fast after repeated failures
+
+    After threshold consecutive failures the circuit opens for cooldown
+    seconds; then a single trial request decides whether it closes again.
+    """
+
+    def __init__(self, threshold=CIRCUIT_THRESHOLD, cooldown=CIRCUIT_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._opened = {}
+        self._lock = Lock()
+
+    def check(self, key):
+        with self._lock:
+            opened = self._opened.get(key)
+            if opened is None:
+                return
+            if time.monotonic() - opened < self.cooldown:
+                count_event('circuit_open')
+                raise CircuitOpenError(f"too many failures for {key}, skipping it for now")
+            # Half open: let this request through and hold the others back until it is done
+            self._opened[key] = time.monotonic()
+
+    def success(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._opened.pop(key, None)
+
+    def failure(self, key):
+        with self._lock:
+            self._failures[key] = self._failures.get(key, 0) + 1
+            if self._failures[key] >= self.threshold:
+                if key not in self._opened:
+                    logging.warning(f"{key}: {self._failures[key]} failed requests in a row, "
+                                    f"pausing its requests for {self.cooldown}s")
+                self._opened[key] = time.monotonic()
+
+
+def retry_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number attempt (0-based): exponential with full jitter"""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY))
+
+
+class Transport:
+    """HTTP(S) client keeping a pool of keep-alive connections per host
+
+    Every request passes the shared RateLimiter, is retried with backoff on
+    429/5xx, timeouts and connection errors, and is failed fast by the
+    CircuitBreaker of its circuit key (the host unless the caller names one).
+
+    host_map redirects hosts to another base url, e.g.
+    {'api.gog.com': 'http://127.0.0.1:8000'} to run against a local stand-in server.
+    """
+
+    def __init__(self, headers=None, timeout=REQUEST_TIMEOUT,
+                 max_idle_per_host=MAX_CONNECTIONS_PER_HOST, host_map=None,
+                 limiter=None, breaker=None, retries=RETRIES):
+        self.headers = dict(DEFAULT_HEADERS)
+        self.headers.update(headers or {})
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.host_map = {host: urlsplit(base) for host, base in (host_map or {}).items()}
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self._idle = {}
+        self._lock = Lock()
+
+    def _target(self, url):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        mapped = self.host_map.get(parts.hostname)
+        if mapped:
+            return (mapped.scheme, mapped.hostname, mapped.port), parts.netloc, path
+        return (parts.scheme, parts.hostname, parts.port), parts.netloc, path
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        if get_metrics() is not None:
+            conn._create_connection = timed_create_connection
+        return conn
+
+    def _open(self, conn):
+        """Connect conn before sending, so the TLS handshake is timed on its own"""
+        _connecting.connected = None
+        conn.connect()
+        count_event('connections')
+        if isinstance(conn, http.client.HTTPSConnection) and _connecting.connected is not None:
+            get_metrics().observe('tls', time.perf_counter() - _connecting.connected)
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, url, headers=None, method='GET', timeout=None):
+        key, netloc, path = self._target(url)
+        request_headers = dict(self.headers)
+        request_headers['Host'] = netloc
+        request_headers.update(headers or {})
+        timeout = timeout or self.timeout
+        while True:
+            conn, reused = self._acquire(key)
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                if conn.sock is None and get_metrics() is not None:
+                    self._open(conn)
+                with timed('wait'):
+                    conn.request(method, path, headers=request_headers)
+                    response = conn.getresponse()
+                return key, conn, response
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                    ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused:
+                    # The server dropped an idle keep-alive connection, retry on a fresh one
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+    def _send_following(self, url, headers=None, method='GET', timeout=None):
+        """_send following redirects like urlopen, also returning the final url
+
+        Redirects to another scheme are refused with an HTTPError.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            key, conn, response = self._send(url, headers, method, timeout)
+            location = response.getheader('Location')
+            if response.status not in REDIRECT_STATUSES or not location:
+                return url, key, conn, response
+            try:
+                response.read()
+            finally:
+                self._finish(key, conn, response)
+            target = urljoin(url, location)
+            if urlsplit(target).scheme != urlsplit(url).scheme:
+                raise HTTPError(url, response.status, f"refusing redirect to another scheme: {target}",
+                                response.headers, None)
+            if response.status == 303 and method != 'HEAD':
+                method = 'GET'
+            logging.debug(f"Following redirect from {url} to {target}")
+            url = target
+        raise HTTPError(url, response.status, f"more than {MAX_REDIRECTS} redirects", response.headers, None)
+
+    def _finish(self, key, conn, response):
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self._release(key, conn)
+
+    def _with_retries(self, url, attempt_once, circuit=None, timeout=None, deadline=None):
+        """Run attempt_once(timeout) under the rate limiter, retrying transient failures
+
+        deadline is a time.monotonic() value no attempt may run past: each
+        attempt's timeout is cut to the time left and no retry starts after it.
+        """
+        circuit = circuit or urlsplit(url).hostname
+        self.breaker.check(circuit)
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            if not self.limiter.acquire(deadline):
+                raise DeadlineExceeded(f"no time left for {url}, still waiting for the rate limiter")
+            started = time.monotonic()
+            try:
+                if deadline is not None:
+                    if started >= deadline:
+                        raise DeadlineExceeded(f"no time left for {url}")
+                    result = attempt_once(min(timeout, deadline - started))
+                else:
+                    result = attempt_once(timeout)
+            except HTTPError as e:
+                if e.code == 429:
+                    count_event('throttled')
+                    self.limiter.throttled()
+                if e.code not in RETRY_STATUSES:
+                    raise
+                error, delay = e, retry_delay(attempt, e.headers.get('Retry-After') if e.headers else None)
+            except (OSError, http.client.HTTPException) as e:
+                # Timeouts, refused and dropped connections
+                error, delay = e, retry_delay(attempt)
+            else:
+                elapsed = time.monotonic() - started
+                self.limiter.succeeded(elapsed)
+                self.breaker.success(circuit)
+                metrics = get_metrics()
+                if metrics is not None:
+                    metrics.observe('request', elapsed, circuit)
+                return result
+            finally:
+                self.limiter.release()
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                # Out of time rather than a failing country, so the circuit is left alone
+                raise error
+            if attempt >= self.retries:
+                self.breaker.failure(circuit)
+                raise error
+            count_event('retries')
+            logging.debug(f"Retrying {url} in {delay:.2f}s after: {error}")
+            time.sleep(delay)
+            attempt += 1
+
+    def _request_once(self, url, headers, method, timeout):
+        url, key, conn, response = self._send_following(url, headers, method, timeout)
+        with timed('transfer'):
+            try:
+                body = response.read()
+            finally:
+                self._finish(key, conn, response)
+            body = decode_body(body, response.getheader('Content-Encoding'))
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        return Response(url, response.status, response.headers, body)
+
+    def _open_once(self, url, headers, timeout):
+        url, key, conn, response = self._send_following(url, headers, timeout=timeout)
+        if response.status >= 400:
+            try:
+                response.read()
+            finally:
+                self._finish(key, conn, response)
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        return key, conn, response
+
+    def request(self, url, headers=None, method='GET', circuit=None, timeout=None, deadline=None):
+        """Send a request over a pooled connection and return the decoded Response
+
+        Redirects are followed and HTTPError is raised for 4xx/5xx statuses,
+        like urllib.request.urlopen.
+        """
+        return self._with_retries(url, lambda timeout: self._request_once(url, headers, method, timeout),
+                                  circuit, timeout, deadline)
+
+    @contextmanager
+    def stream(self, url, headers=None, chunk_size=STREAM_CHUNK_SIZE, circuit=None, timeout=None, deadline=None):
+        """Yield an iterator over decoded body chunks of a GET request
+
+        Leaving the block before the body is exhausted drops the connection
+        instead of reading the remainder. Only opening the response is retried.
+        """
+        key, conn, response = self._with_retries(url, lambda timeout: self._open_once(url, headers, timeout),
+                                                 circuit, timeout, deadline)
+        try:
+            content_encoding = (response.getheader('Content-Encoding') or '').lower()
+            decompressor = None
+            if content_encoding == 'gzip':
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif content_encoding == 'deflate':
+                decompressor = zlib.decompressobj()
+
+            def chunks():
+                while True:
+                    data = response.read(chunk_size)
+                    if not data:
+                        break
+                    if decompressor:
+                        data = decompressor.decompress(data)
+                    if data:
+                        yield data
+                if decompressor:
+                    tail = decompressor.flush()
+                    if tail:
+                        yield tail
+
+            yield chunks()
+        finally:
+            self._finish(key, conn, response)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+_transport = None
+_transport_lock = Lock()
+
+
+def get_transport():
+    """Return the process-wide Transport shared by every fetch path"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
+
+
+def set_transport(transport):
+    """Replace the shared Transport, e.g. with one pointing at a local server"""
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    if previous is not None and previous is not transport:
+        previous.close()
+
+
+class CacheEntry:
+    def __init__(self, body, etag, last_modified, fetched_at, ttl):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+
+    @property
+    def fresh(self):
+        return time.time() - self.fetched_at < self.ttl
+
+    def validators(self):
+        """Headers for a conditional request revalidating this entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class Cache:
+    """SQLite store of price responses keyed by (product_id, country_code)
+
+    Entries older than ttl are revalidated with ETag/Last-Modified when the API
+    sent them. Beyond max_entries the least recently used entries are evicted.
+    With refresh set, fresh entries are revalidated too.
+    """
+    # Puts between two eviction passes
+    EVICT_EVERY = 500
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, refresh=False):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'cache.sqlite3')
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._lock = Lock()
+        self._accessed = {}
+        self._puts = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS prices (
+            product_id TEXT NOT NULL,
+            country_code TEXT NOT NULL,
+            body BLOB NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (product_id, country_code))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS prices_accessed_at ON prices (accessed_at)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS slugs (
+            slug TEXT PRIMARY KEY,
+            product_id TEXT NOT NULL,
+            accessed_at REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS slugs_accessed_at ON slugs (accessed_at)")
+
+    def get_price(self, product_id, country_code):
+        key = (str(product_id), country_code)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM prices "
+                "WHERE product_id = ? AND country_code = ?", key).fetchone()
+            if row is None:
+                return None
+            # Access times are written in bulk with the next put instead of per read
+            self._accessed[key] = time.time()
+        entry = CacheEntry(row[0], row[1], row[2], row[3], self.ttl)
+        if self.refresh:
+            entry.ttl = 0
+        return entry
+
+    def put_price(self, product_id, country_code, body, etag=None, last_modified=None):
+        now = time.time()
+        key = (str(product_id), country_code)
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (body, etag, last_modified, now, now))
+                self._flush_accessed()
+                self._puts += 1
+                if self._puts % self.EVICT_EVERY == 0:
+                    self._evict()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def touch_price(self, product_id, country_code):
+        """Mark an entry as fetched now after the API confirmed it is unchanged"""
+        key = (str(product_id), country_code)
+        with self._lock:
+            self._db.execute(
+                "UPDATE prices SET fetched_at = ? "
+                "WHERE product_id = ? AND country_code = ?", (time.time(),) + key)
+
+    def get_product_id(self, slug):
+        with self._lock:
+            row = self._db.execute("SELECT product_id FROM slugs WHERE slug = ?", (slug,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE slugs SET accessed_at = ? WHERE slug = ?", (time.time(), slug))
+        return row[0]
+
+    def put_product_ids(self, slugs):
+        """Remember product ids of game slugs, given as (slug, product_id) pairs"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO slugs VALUES (?, ?, ?)",
+                                     ((slug, str(product_id), now) for slug, product_id in slugs))
+                excess = self._db.execute("SELECT COUNT(*) FROM slugs").fetchone()[0] - SLUG_MAX_ENTRIES
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM slugs WHERE rowid IN "
+                        "(SELECT rowid FROM slugs ORDER BY accessed_at LIMIT ?)", (excess,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE prices SET accessed_at = ? "
+                "WHERE product_id = ? AND country_code = ?",
+                [(accessed_at,) + key for key, accessed_at in self._accessed.items()])
+            self._accessed.clear()
+
+    def _evict(self):
+        excess = self._db.execute("SELECT COUNT(*) FROM prices").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM prices WHERE rowid IN "
+                "(SELECT rowid FROM prices ORDER BY accessed_at LIMIT ?)", (excess,))
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self._evict()
+            self._db.close()
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide Cache, or None when caching is disabled"""
+    return _cache
+
+
+def set_cache(cache):
+    global _cache
+    previous, _cache = _cache, cache
+    if previous is not None and previous is not cache:
+        previous.close()
+
+
+class FxRates:
+    """Exchange rates as units of a currency per USD
+
+    load() starts from a snapshot cached in CACHE_DIR/fx_rates.json and
+    refreshes it from FX_RATES_URL once it is older than ttl; get_fx() loads
+    again when the snapshot in use expires, so long-running commands keep up.
+    Currencies missing from the snapshot are learned from GOG responses
+    carrying both a local and a USD price.
+    """
+
+    def __init__(self, rates=None, ttl=None, fetched_at=None):
+        self.rates = {'USD': 1.0}
+        self.rates.update(rates or {})
+        self.ttl = ttl
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self._observed = {}
+
+    @property
+    def expired(self):
+        return self.ttl is not None and time.time() - self.fetched_at >= self.ttl
+
+    @classmethod
+    def load(cls, path=None, ttl=FX_TTL, url=FX_RATES_URL):
+        path = path or os.path.join(CACHE_DIR, 'fx_rates.json')
+        snapshot = None
+        try:
+            with open(path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            pass
+        fetched_at = snapshot.get('fetched_at', 0) if snapshot else 0
+        if time.time() - fetched_at >= ttl:
+            # A failed refresh is not retried before another ttl has passed
+            fetched_at = time.time()
+            try:
+                rates = json.loads(get_transport().request(url).body)['rates']
+                snapshot = {'fetched_at': time.time(), 'rates': rates}
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f)
+            except Exception as e:
+                fallback = "using the cached snapshot" if snapshot else "no snapshot to fall back to"
+                logging.warning(f"Could not refresh exchange rates, {fallback}: {e}")
+        return cls(snapshot.get('rates') if snapshot else None, ttl, fetched_at)
+
+    @classmethod
+    def from_file(cls, path):
+        """Read a fixed rate table: {"EUR": 0.92, ...} or {"rates": {...}}"""
+        with open(path, encoding='utf-8') as f:
+            rates = json.load(f)
+        return cls(rates.get('rates', rates))
+
+    def rate(self, currency):
+        return self.rates.get(currency) or self._observed.get(currency)
+
+    def observe(self, currency, value, value_usd):
+        """Learn a rate from a price GOG reported in both currencies"""
+        if currency and value and value_usd:
+            self._observed[currency] = value / value_usd
+
+    def to_usd(self, values, currencies):
+        """Convert parallel lists of values and currencies to USD in one pass
+
+        Values that are None or in an unknown currency become None.
+        """
+        rates = {currency: self.rate(currency) for currency in set(currencies)}
+        return [None if value is None or not rates[currency] else value / rates[currency]
+                for value, currency in zip(values, currencies)]
+
+
+_fx = None
+_fx_lock = Lock()
+
+
+def get_fx():
+    """Return the process-wide FxRates, loading the cached snapshot on first use
+
+    A snapshot older than its ttl is replaced by a freshly loaded one.
+    """
+    global _fx
+    with _fx_lock:
+        if _fx is None or _fx.expired:
+            _fx = FxRates.load(ttl=FX_TTL if _fx is None else _fx.ttl)
+        return _fx
+
+
+def set_fx(fx):
+    global _fx
+    with _fx_lock:
+        _fx = fx
+
+
+class PriceRegions:
+    """Groups of countries that GOG always prices identically
+
+    Regions are learned from products checked in every country: countries
+    stay in one region only while they saw the same currency and value for
+    every product. Once min_samples products agree, only the first country of
+    each region is queried and its price is copied to the others. Every
+    verify_every-th product is checked in all countries again, splitting the
+    regions that no longer agree. The count of planned products is saved with
+    the regions (by learn(), on every verification and by save() at the end
+    of a run), so short runs still take their turn at verifying.
+    """
+
+    def __init__(self, regions=None, samples=0, path=None,
+                 min_samples=REGION_MIN_SAMPLES, verify_every=REGION_VERIFY_EVERY, planned=0):
+        self.region = {}
+        for index, members in enumerate(regions or []):
+            for code in members:
+                self.region[code] = index
+        self.samples = samples
+        self.path = path
+        self.min_samples = min_samples
+        self.verify_every = verify_every
+        self.planned = planned
+        self._lock = Lock()
+
+    @classmethod
+    def load(cls, path=None):
+        """Regions learned by earlier runs, saved in CACHE_DIR/price_regions.json"""
+        path = path or os.path.join(CACHE_DIR, 'price_regions.json')
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            return cls(saved['regions'], saved['samples'], path, planned=saved.get('planned', 0))
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls(path=path)
+
+    @classmethod
+    def from_file(cls, path):
+        """Read fixed regions: [["DE", "FR", ...], ...] or {"regions": [...]}
+
+        Fixed regions are trusted right away and verification never overwrites the file.
+        """
+        with open(path, encoding='utf-8') as f:
+            regions = json.load(f)
+        if isinstance(regions, dict):
+            regions = regions['regions']
+        return cls(regions, REGION_MIN_SAMPLES)
+
+    @property
+    def learning(self):
+        return self.samples < self.min_samples
+
+    def regions(self):
+        grouped = {}
+        for code, index in self.region.items():
+            grouped.setdefault(index, []).append(code)
+        return list(grouped.values())
+
+    def plan(self, countries):
+        """Split countries into those to query and those copying a queried one
+
+        Returns (queried, copies) where copies maps a queried country code to
+        the (code, name) of countries sharing its region, or None when every
+        country has to be queried to learn or verify the regions.
+        """
+        with self._lock:
+            self.planned += 1
+            if self.learning or self.planned % self.verify_every == 0:
+                self._save()
+                return countries, None
+            queried = []
+            copies = {}
+            representatives = {}
+            for code, name in countries:
+                index = self.region.get(code)
+                representative = representatives.get(index) if index is not None else None
+                if representative is None:
+                    if index is not None:
+                        representatives[index] = code
+                    queried.append((code, name))
+                else:
+                    copies.setdefault(representative, []).append((code, name))
+            return queried, copies
+
+    def learn(self, prices):
+        """Refine the regions with the prices of one product queried in every country
+
+        prices must only hold countries whose request succeeded. Countries
+        left out keep their old region, which no refined region reuses.
+        """
+        with self._lock:
+            before = len(self.regions()) if self.samples else None
+            # Refined regions are numbered past the old ones, so a country left
+            # out is never merged into an unrelated region by index
+            first = max(self.region.values(), default=-1) + 1
+            refined = {}
+            for price in prices:
+                key = (self.region.get(price.country_code), price.currency, price.value)
+                self.region[price.country_code] = refined.setdefault(key, first + len(refined))
+            self.samples += 1
+            after = len(self.regions())
+            if before is not None and after != before and self.samples > self.min_samples:
+                logging.info(f"Price regions diverged, {before} regions became {after}")
+            self._save()
+
+    def save(self):
+        """Write the regions and the planned count, e.g. when a run ends"""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        # Written aside and renamed, so a concurrent load never sees half a file
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump({'samples': self.samples, 'planned': self.planned, 'regions': self.regions()}, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logging.error(f"Error saving price regions: {e}")
+
+
+_regions = None
+
+
+def get_regions():
+    """Return the process-wide PriceRegions, or None when every country is always queried"""
+    return _regions
+
+
+def set_regions(regions):
+    global _regions
+    _regions = regions
+
+
+def fetch_price_body(product_id, country_code, deadline=None):
+    """Return the raw price response, from the cache when it is fresh"""
+    cache = get_cache()
+    entry = cache.get_price(product_id, country_code) if cache else None
+    if entry is not None and entry.fresh:
+        count_event('cache_hit')
+        return entry.body
+    count_event('cache_revalidate' if entry is not None else 'cache_miss')
+    url = price_url(product_id, country_code)
+    logging.debug(url)
+    response = get_transport().request(url, entry.validators() if entry else None, circuit=country_code,
+                                       deadline=deadline)
+    if response.status == 304 and entry is not None:
+        count_event('cache_not_modified')
+        cache.touch_price(product_id, country_code)
+        return entry.body
+    if cache:
+        cache.put_price(product_id, country_code, response.body,
+                        response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response.body
+
+
+_CARD_PRODUCT = re.compile(r'card-product="(\d+)"')
+_GAME_SLUG = re.compile(r'/game/([^/?#]+)')
+
+
+def game_slug(url):
+    """Slug of a gog.com game page url, e.g. 'diablo' for https://www.gog.com/game/diablo"""
+    match = _GAME_SLUG.search(urlsplit(url).path)
+    return match.group(1).lower() if match else None
+
+
+def load_slug_catalog(path):
+    """Read (slug, product_id) pairs from a catalog dump
+
+    Accepts a JSON list of products, an object with a 'products' list, or text
+    lines of 'slug,product_id'.
+    """
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    try:
+        catalog = json.loads(content)
+    except ValueError:
+        pairs = []
+        for line in content.splitlines():
+            parts = [part.strip() for part in line.split(',')]
+            if len(parts) == 2 and parts[1].isdigit():
+                pairs.append((parts[0].lower(), parts[1]))
+        return pairs
+    if isinstance(catalog, dict):
+        catalog = catalog.get('products') or []
+    return [(str(product['slug']).lower(), str(product['id']))
+            for product in catalog
+            if isinstance(product, dict) and product.get('slug') and product.get('id')]
+
+
 def extract_product_id(url):
-    html = urllib_request.urlopen(url).read().decode('utf-8')
-    raw_card_product = re.search(r"card-product=\"\d*\"", html).group()
-    product_id = re.search(r"(\d+)", raw_card_product).group()
-    logging.debug(f"raw product id: {raw_card_product}")
+    slug = game_slug(url)
+    cache = get_cache()
+    if slug and cache:
+        product_id = cache.get_product_id(slug)
+        if product_id:
+            logging.debug(f"product id of {slug} from cache: {product_id}")
+            return product_id
+
+    # Stream the page and stop reading once the attribute shows up
+    tail = ''
+    match = None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with get_transport().stream(url) as chunks:
+        for chunk in chunks:
+            text = tail + decoder.decode(chunk)
+            match = _CARD_PRODUCT.search(text)
+            if match:
+                break
+            tail = text[-64:]
+    if match is None:
+        raise ValueError(f"Could not find product id on {url}")
+    product_id = match.group(1)
+    logging.debug(f"raw product id: {match.group()}")
     logging.debug(f"product id: {product_id}")
+    if slug and cache:
+        cache.put_product_ids([(slug, product_id)])
     return product_id
 
 
-def request_price(product_id, price, normalize=None):
-    data = None
-    url = f"https://api.gog.com/products/{product_id}/prices?countryCode={price.country_code}"
-    if normalize:
-        url += "&currency=USD"
-    try:
-        logging.debug(url)
-        response = urllib_request.urlopen(url).read().decode('utf-8')
-        data = json.loads(response)
+# "finalPrice": "1999 USD" entries of a price response, in document order
+_FINAL_PRICE = re.compile(rb'"finalPrice"\s*:\s*"(\d+) ([A-Z]{3})"')
+
+
+def parse_price_body(body):
+    """Return (value, currency, value_usd) of a raw price response
+
+    The first price is the local one, value_usd comes from the USD price if
+    there is one. The finalPrice fields are picked straight out of the bytes;
+    only a response they cannot be found in is decoded as a whole.
+    Raises KeyError for a response that is not a price response.
+    """
+    matches = _FINAL_PRICE.findall(body)
+    if not matches:
+        data = json_loads(body)
         logging.debug(data)
-        for i , item in enumerate(data['_embedded']['prices']):
-            if i == 0:
-                final_price = item['finalPrice'].split(" ")
-                price.value = int(final_price[0]) / 100
-                price.currency = final_price[1]
-            if item['currency']['code'] == "USD":
-                price.value_usd = int(item['finalPrice'].split(" ")[0]) / 100
-        logging.debug(price)
+        return price_fields(data['_embedded']['prices'])
+    value_usd = None
+    for amount, currency in matches:
+        if currency == b'USD':
+            value_usd = int(amount) / 100
+    amount, currency = matches[0]
+    return int(amount) / 100, currency.decode('ascii'), value_usd
+
+
+def price_fields(prices):
+    """(value, currency, value_usd) of the decoded prices list of a response"""
+    if not prices:
+        # Not sold in this country
+        return None, None, None
+    value_usd = None
+    for item in prices:
+        amount, currency = item['finalPrice'].split(' ', 1)
+        if currency == 'USD':
+            value_usd = int(amount) / 100
+    amount, currency = prices[0]['finalPrice'].split(' ', 1)
+    return int(amount) / 100, currency, value_usd
+
+
+def set_price(price, value, currency, value_usd):
+    price.value, price.currency = value, currency
+    if value_usd is not None:
+        price.value_usd = value_usd
+    if price.value_usd is not None and price.currency != "USD":
+        get_fx().observe(price.currency, price.value, price.value_usd)
+    logging.debug(price)
+
+
+def request_price(product_id, price, deadline=None):
+    body = None
+    try:
+        body = fetch_price_body(product_id, price.country_code, deadline)
+        with timed('parse'):
+            fields = parse_price_body(body)
+        set_price(price, *fields)
     except KeyError as no_key_error:
         logging.error(no_key_error)
-        logging.error(data)
+        logging.error(body)
+    return price
+
+
+def bulk_price_url(product_ids, country_code):
+    return f"https://api.gog.com/products/prices?ids={','.join(product_ids)}&countryCode={country_code}"
+
+
+def request_prices_bulk(entries, country_code, deadline=None):
+    """Fill the prices of several products in one country with one request
+
+    entries are (product_id, Price) pairs of country_code. Fresh cached prices
+    are used as they are and the rest are asked for with a single
+    multi-product request. Returns the entries the response had nothing for,
+    to be requested one by one.
+    """
+    cache = get_cache()
+    wanted = []
+    for product_id, price in entries:
+        entry = cache.get_price(product_id, country_code) if cache else None
+        if entry is not None and entry.fresh:
+            count_event('cache_hit')
+            set_price(price, *parse_price_body(entry.body))
+        else:
+            count_event('cache_miss')
+            wanted.append((product_id, price))
+    if not wanted:
+        return []
+    url = bulk_price_url([product_id for product_id, _ in wanted], country_code)
+    logging.debug(url)
+    response = get_transport().request(url, circuit=country_code, deadline=deadline)
+    with timed('parse'):
+        found = {str(item['_embedded']['product']['id']): item['_embedded']['prices']
+                 for item in json_loads(response.body)['_embedded']['items']}
+    absent = []
+    for product_id, price in wanted:
+        prices = found.get(product_id)
+        if prices is None:
+            absent.append((product_id, price))
+            continue
+        set_price(price, *price_fields(prices))
+        if cache:
+            # Cached like a single product response, so later single checks can use it
+            cache.put_price(product_id, country_code,
+                            json.dumps({'_embedded': {'prices': prices}}).encode('utf-8'), None, None)
+    return absent
+
+
+class PriceHistory:
+    """Append-only price history stored column by column
+
+    Every column is a flat array file (timestamp, product_id, country,
+    currency, value, value_usd) read through mmap, so queries never load the
+    whole history. Countries and currencies are stored as indexes into small
+    dictionary files, missing values as NaN. by_product/<id> and
+    by_country/<code> list the rows of a product or country. Appends hold an
+    exclusive lock on the lock file, so several processes can share a history.
+    """
+    COLUMNS = (('timestamp', 'd'), ('product_id', 'q'), ('country', 'H'),
+               ('currency', 'H'), ('value', 'd'), ('value_usd', 'd'))
+
+    def __init__(self, path=None):
+        self.path = path or HISTORY_DIR
+        os.makedirs(os.path.join(self.path, 'by_product'), exist_ok=True)
+        os.makedirs(os.path.join(self.path, 'by_country'), exist_ok=True)
+        self._lock = Lock()
+        self._reload_dictionaries()
+
+    def _file(self, *parts):
+        return os.path.join(self.path, *parts)
+
+    def _load_dictionary(self, name):
+        try:
+            with open(self._file(f'{name}.txt'), encoding='utf-8') as f:
+                words = f.read().splitlines()
+        except FileNotFoundError:
+            words = []
+        return words, {word: index for index, word in enumerate(words)}
+
+    @contextmanager
+    def _write_lock(self):
+        """Hold the thread lock and the cross-process lock of the history directory"""
+        with self._lock, open(self._file('lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _reload_dictionaries(self):
+        # Another process may have added words since they were read
+        self._dictionaries = {name: self._load_dictionary(name) for name in ('country', 'currency')}
+
+    def _code(self, name, word):
+        words, codes = self._dictionaries[name]
+        word = word or ''
+        if word not in codes:
+            codes[word] = len(words)
+            words.append(word)
+            with open(self._file(f'{name}.txt'), 'a', encoding='utf-8') as f:
+                f.write(word + '\n')
+        return codes[word]
+
+    def __len__(self):
+        # A write interrupted half way leaves some columns longer, ignore their tail (append cuts it)
+        return min(os.path.getsize(self._file(name)) // array(typecode).itemsize
+                   if os.path.exists(self._file(name)) else 0
+                   for name, typecode in self.COLUMNS)
+
+    def append(self, product_id, prices, timestamp=None):
+        """Record the prices of one product, skipping countries without a price"""
+        prices = [price for price in prices if price.value is not None]
+        if not prices:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._write_lock():
+            self._reload_dictionaries()
+            first_row = len(self)
+            # Drop the tail a torn write left, so the new row lines up in every column
+            for name, typecode in self.COLUMNS:
+                size = first_row * array(typecode).itemsize
+                if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > size:
+                    os.truncate(self._file(name), size)
+            columns = {
+                'timestamp': [timestamp] * len(prices),
+                'product_id': [int(product_id)] * len(prices),
+                'country': [self._code('country', price.country_code) for price in prices],
+                'currency': [self._code('currency', price.currency) for price in prices],
+                'value': [float(price.value) for price in prices],
+                'value_usd': [math.nan if price.value_usd is None else float(price.value_usd)
+                              for price in prices],
+            }
+            for name, typecode in self.COLUMNS:
+                with open(self._file(name), 'ab') as f:
+                    array(typecode, columns[name]).tofile(f)
+            rows = range(first_row, first_row + len(prices))
+            with open(self._file('by_product', str(int(product_id))), 'ab') as f:
+                array('I', rows).tofile(f)
+            by_country = OrderedDict()
+            for row, price in zip(rows, prices):
+                by_country.setdefault(price.country_code, array('I')).append(row)
+            for country_code, country_rows in by_country.items():
+                with open(self._file('by_country', country_code), 'ab') as f:
+                    country_rows.tofile(f)
+
+    def _row_index(self, kind, key):
+        rows = array('I')
+        try:
+            with open(self._file(kind, key), 'rb') as f:
+                rows.frombytes(f.read())
+        except FileNotFoundError:
+            pass
+        return rows
+
+    @contextmanager
+    def _columns(self):
+        """Map every column read-only as a typed memoryview"""
+        files, maps, views = [], [], {}
+        try:
+            count = len(self)
+            for name, typecode in self.COLUMNS:
+                if not count:
+                    views[name] = array(typecode)
+                    continue
+                f = open(self._file(name), 'rb')
+                files.append(f)
+                maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                size = count * array(typecode).itemsize
+                views[name] = memoryview(maps[-1])[:size].cast(typecode)
+            yield count, views
+        finally:
+            for view in views.values():
+                if isinstance(view, memoryview):
+                    view.release()
+            for m in maps:
+                m.close()
+            for f in files:
+                f.close()
+
+    def rows(self, product_id=None, country_code=None, since=None):
+        """Yield (timestamp, product_id, country_code, currency, value, value_usd)
+
+        Uses the product or country row index when given, otherwise scans.
+        """
+        self._reload_dictionaries()
+        countries = self._dictionaries['country'][0]
+        currencies = self._dictionaries['currency'][0]
+        with self._columns() as (count, columns):
+            if product_id is not None:
+                row_ids = self._row_index('by_product', str(int(product_id)))
+            elif country_code is not None:
+                row_ids = self._row_index('by_country', country_code)
+            elif since is not None:
+                # Rows are appended in time order, so skip straight to the first recent one
+                row_ids = range(bisect_left(columns['timestamp'], since), count)
+            else:
+                row_ids = range(count)
+            timestamps = columns['timestamp']
+            for row in row_ids:
+                if row >= count or (since is not None and timestamps[row] < since):
+                    continue
+                if product_id is not None and columns['product_id'][row] != int(product_id):
+                    continue
+                country = countries[columns['country'][row]]
+                if country_code is not None and country != country_code:
+                    continue
+                value_usd = columns['value_usd'][row]
+                yield (timestamps[row], columns['product_id'][row], country,
+                       currencies[columns['currency'][row]], columns['value'][row],
+                       None if math.isnan(value_usd) else value_usd)
+
+    def lowest(self, product_id, country_code=None, since=None):
+        """Row with the lowest USD price recorded for a product, or None"""
+        return min((row for row in self.rows(product_id, country_code, since) if row[5] is not None),
+                   key=lambda row: row[5], default=None)
+
+    def cheapest_countries(self, product_id=None, since=None):
+        """[(country_code, lowest USD price)] from cheapest to most expensive"""
+        best = {}
+        for row in self.rows(product_id, since=since):
+            if row[5] is not None and (row[2] not in best or row[5] < best[row[2]]):
+                best[row[2]] = row[5]
+        return sorted(best.items(), key=lambda item: item[1])
+
+
+_history = None
+
+
+def get_history():
+    """Return the process-wide PriceHistory, or None when recording is disabled"""
+    return _history
+
+
+def set_history(history):
+    global _history
+    _history = history
+
+
+class FetchEngine:
+    """Shared, size-limited worker pool with per-host connection limits"""
+
+    def __init__(self, max_workers=MAX_WORKERS, max_per_host=MAX_CONNECTIONS_PER_HOST):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._host_slots = {}
+        self._lock = Lock()
+
+    def host_slot(self, url):
+        host = urlsplit(url).hostname
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def submit(self, url, fn, *args, **kwargs):
+        """Run fn in the pool while holding a connection slot for url's host"""
+        slot = self.host_slot(url)
+
+        def run():
+            with slot:
+                return fn(*args, **kwargs)
+
+        return self._executor.submit(run)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
 
+    def __enter__(self):
+        return self
 
-def request_prices(product_id, normalize=None):
-    threads = []
-    for price in COUNTRY_PRICES:
-        t = Thread(target=request_price, args=(product_id, price, normalize))
-        threads.append(t)
-        t.start()
-    for t in threads:
-        t.join()
+    def __exit__(self, *exc_info):
+        self.shutdown()
 
 
-def sort_prices():
-    return sorted(COUNTRY_PRICES, key=lambda x: x.value_usd, reverse=False)
+def price_url(product_id, country_code):
+    return f"https://api.gog.com/products/{product_id}/prices?countryCode={country_code}"
 
 
-def out_result(count, pretty=None):
-    sorted_prices = sort_prices()
-    count = min(abs(count), len(sorted_prices))
-    out_string = ""
+def convert_prices(prices, fx=None):
+    """Set value_usd of every price from its local value in one pass over the FX table
+
+    Prices in a currency without a known rate keep the USD price GOG sent, if any.
+    """
+    fx = fx or get_fx()
+    converted = fx.to_usd([price.value for price in prices], [price.currency for price in prices])
+    for price, value_usd in zip(prices, converted):
+        if value_usd is not None:
+            price.value_usd = round(value_usd, 2)
+    return prices
+
+
+def iter_prices(product_ids, countries=None, engine=None, on_price=None, deadline=None, bulk=True):
+    """Yield (product_id, prices) as soon as every country of a product is done
+
+    All product x country requests share one engine, so checking many products
+    costs no more threads than checking one. With price regions set up, only
+    one country per region is queried and the others copy its price; while the
+    regions are still being learned, products wait for the ones checked in
+    every country. value_usd of every price is converted locally from its own
+    currency. on_price(product_id, price) is called from the iterating thread
+    for every country as soon as its price is known.
+
+    With a deadline in seconds, requests still outstanding when it passes are
+    cancelled and the remaining products are yielded right away, their
+    unanswered countries replaced by Price objects marked missing.
+
+    With bulk, products submitted together are asked for with one
+    multi-product request per country, up to BULK_PRICE_IDS at a time.
+    Products missing from a bulk response and products of a failed bulk
+    request fall back to one request each; an endpoint rejecting bulk
+    requests turns bulk off for the rest of the run.
+    """
+    countries = COUNTRIES if countries is None else countries
+    if isinstance(countries, dict):
+        countries = list(countries.items())
+    else:
+        countries = [(code, COUNTRIES.get(code, code)) for code in countries]
+    regions = get_regions()
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    own_engine = engine is None
+    engine = engine or FetchEngine()
+    try:
+        product_ids = iter(product_ids)
+        pending = {}
+        results = {}
+        copies = {}
+        by_country_code = {}
+        succeeded = {}
+        answered = {}
+        futures = set()
+        use_bulk = [bulk]
+
+        def submit_price(product_id, price):
+            future = engine.submit(price_url(product_id, price.country_code),
+                                   request_price, product_id, price, deadline_at)
+            future.entries = [(product_id, price)]
+            future.bulk = False
+            futures.add(future)
+
+        def submit_bulk(batch):
+            if not use_bulk[0] or len(batch) < 2:
+                for product_id, price in batch:
+                    submit_price(product_id, price)
+                return
+            by_country = OrderedDict()
+            for product_id, price in batch:
+                by_country.setdefault(price.country_code, []).append((product_id, price))
+            for country_code, entries in by_country.items():
+                for start in range(0, len(entries), BULK_PRICE_IDS):
+                    chunk = entries[start:start + BULK_PRICE_IDS]
+                    if len(chunk) == 1:
+                        submit_price(*chunk[0])
+                        continue
+                    future = engine.submit(bulk_price_url([product_id for product_id, _ in chunk], country_code),
+                                           request_prices_bulk, chunk, country_code, deadline_at)
+                    future.entries = chunk
+                    future.bulk = True
+                    futures.add(future)
+
+        def submit_products():
+            if out_of_time(deadline_at):
+                return
+            batch = []
+            learning = 0
+            for product_id in product_ids:
+                product_id = str(product_id)
+                if product_id in results:
+                    continue
+                results[product_id] = [Price(code, name) for code, name in countries]
+                by_country_code[product_id] = {price.country_code: price for price in results[product_id]}
+                queried, copies[product_id] = regions.plan(countries) if regions is not None else (countries, None)
+                queried = {code for code, _ in queried}
+                pending[product_id] = len(queried)
+                succeeded[product_id] = []
+                answered[product_id] = set()
+                batch.extend((product_id, price) for price in results[product_id]
+                             if price.country_code in queried)
+                if regions is not None and regions.learning:
+                    learning += 1
+                    if learning >= regions.min_samples:
+                        # The rest can wait for the regions these products teach
+                        break
+            submit_bulk(batch)
+
+        def complete(product_id):
+            prices = results[product_id]
+            missing = [price.country_code for price in prices if price.missing]
+            if missing:
+                logging.warning(f"Product {product_id}: no answer before the deadline from "
+                                f"{len(missing)} of {len(prices)} countries: {', '.join(missing)}")
+            elif copies[product_id] is None and regions is not None:
+                regions.learn(succeeded[product_id])
+            convert_prices(prices)
+            history = get_history()
+            if history is not None:
+                try:
+                    history.append(product_id, [price for price in prices if not price.missing])
+                except OSError as e:
+                    logging.error(f"Error recording price history: {e}")
+            return product_id, prices
+
+        def finish(product_id, source, ok, late):
+            if ok:
+                succeeded[product_id].append(source)
+            completed = [source]
+            if copies[product_id]:
+                by_country = by_country_code[product_id]
+                for code, _ in copies[product_id].get(source.country_code, ()):
+                    price = by_country[code]
+                    price.currency, price.value, price.value_usd = \
+                        source.currency, source.value, source.value_usd
+                    completed.append(price)
+            if late:
+                for price in completed:
+                    price.missing = True
+            else:
+                answered[product_id].update(price.country_code for price in completed)
+            if on_price is not None and not late:
+                for price in convert_prices(completed):
+                    on_price(product_id, price)
+            pending[product_id] -= 1
+            if not pending[product_id]:
+                yield complete(product_id)
+
+        submit_products()
+        while futures:
+            timeout = None if deadline_at is None else max(deadline_at - time.monotonic(), 0)
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                futures.discard(future)
+                entries = future.entries
+                ok = late = False
+                try:
+                    retry = future.result()
+                    if not future.bulk:
+                        # A single request returns its Price, nothing to retry
+                        retry = []
+                    ok = True
+                except CircuitOpenError as e:
+                    logging.debug(f"Skipped price for {len(entries)} product(s): {e}")
+                except Exception as e:
+                    late = out_of_time(deadline_at)
+                    if not late and future.bulk:
+                        # Nothing of the chunk is known, ask for every product on its own
+                        if isinstance(e, HTTPError) and 400 <= e.code < 500 and e.code != 429:
+                            if use_bulk[0]:
+                                logging.warning(f"Bulk price requests rejected, requesting products "
+                                                f"one by one: {e}")
+                            use_bulk[0] = False
+                        else:
+                            logging.warning(f"Bulk price request failed, requesting {len(entries)} products "
+                                            f"one by one: {e}")
+                        for product_id, price in entries:
+                            submit_price(product_id, price)
+                        continue
+                    if not late:
+                        logging.error(f"Error requesting price for product {entries[0][0]}: {e}")
+                if ok and retry:
+                    logging.debug(f"Bulk price response lacked {len(retry)} products, requesting them one by one")
+                    for product_id, price in retry:
+                        submit_price(product_id, price)
+                    retried = {id(price) for _, price in retry}
+                    entries = [entry for entry in entries if id(entry[1]) not in retried]
+                for product_id, price in entries:
+                    yield from finish(product_id, price, ok, late)
+            if not futures or (regions is not None and not regions.learning):
+                submit_products()
+
+        if futures or out_of_time(deadline_at):
+            # Out of time: late answers must not change prices already handed out,
+            # so unanswered countries get fresh Price objects marked missing
+            for future in futures:
+                future.cancel()
+            unfinished = [product_id for product_id, count in pending.items() if count]
+            for product_id in product_ids:
+                product_id = str(product_id)
+                if product_id not in results:
+                    results[product_id] = []
+                    copies[product_id] = None
+                    answered[product_id] = set()
+                    unfinished.append(product_id)
+            for product_id in unfinished:
+                results[product_id] = [price if code in answered[product_id] else Price(code, name, missing=True)
+                                       for (code, name), price in
+                                       zip(countries, results[product_id] or [None] * len(countries))]
+                pending[product_id] = 0
+                yield complete(product_id)
+    finally:
+        if own_engine:
+            engine.shutdown()
+
+
+def fetch_prices(product_ids, countries=None, engine=None, on_price=None, deadline=None):
+    """Fetch prices of several products across countries over one shared engine
+
+    Returns {product_id: [Price, ...]} with prices in the order of countries.
+    """
+    return dict(iter_prices(product_ids, countries, engine, on_price, deadline))
+
+
+def request_prices(product_id, engine=None, on_price=None, deadline=None):
+    """Fetch prices of one product in every country
+
+    Returns a new list of Price, so concurrent checks never share results.
+    With a deadline in seconds, countries that did not answer in time are
+    marked missing instead of being waited for.
+    """
+    return fetch_prices([product_id], engine=engine, on_price=on_price, deadline=deadline)[str(product_id)]
+
+
+def price_rank(price):
+    # Countries without a USD value could not be compared, list them last
+    return (price.value_usd is None, price.value_usd or 0)
+
+
+def sort_prices(prices, count=None):
+    """Prices from cheapest to most expensive, only the count cheapest if given"""
+    if count is not None:
+        # A heap keeps only count items instead of sorting every country
+        return nsmallest(count, prices, key=price_rank)
+    return sorted(prices, key=price_rank)
+
+
+class PriceMatrix:
+    """USD prices of many products across countries in one flat array
+
+    Rows are products and columns are countries; missing prices are NaN.
+    Per-product minimums, top-N selections and statistics work on whole rows
+    or columns at once instead of walking Price objects.
+    """
+
+    def __init__(self, product_ids, countries=None):
+        self.product_ids = [str(product_id) for product_id in product_ids]
+        self.countries = list(COUNTRIES if countries is None else countries)
+        self._rows = {product_id: index for index, product_id in enumerate(self.product_ids)}
+        self._columns = {country_code: index for index, country_code in enumerate(self.countries)}
+        self.values = array('d', [math.nan]) * (len(self.product_ids) * len(self.countries))
+
+    @classmethod
+    def from_prices(cls, product_prices, countries=None):
+        """Build a matrix from {product_id: [Price, ...]} as returned by fetch_prices"""
+        matrix = cls(product_prices, countries)
+        for product_id, prices in product_prices.items():
+            matrix.set_prices(product_id, prices)
+        return matrix
+
+    def set_prices(self, product_id, prices):
+        offset = self._rows[str(product_id)] * len(self.countries)
+        for price in prices:
+            column = self._columns.get(price.country_code)
+            if column is not None and price.value_usd is not None:
+                self.values[offset + column] = price.value_usd
+
+    def row(self, product_id):
+        width = len(self.countries)
+        offset = self._rows[str(product_id)] * width
+        return self.values[offset:offset + width]
+
+    def column(self, country_code):
+        return self.values[self._columns[country_code]::len(self.countries)]
+
+    def minimums(self):
+        """{product_id: (country_code, lowest USD price)} for products with any price"""
+        result = {}
+        for product_id in self.product_ids:
+            row = self.row(product_id)
+            valid = [value for value in row if value == value]
+            if valid:
+                lowest = min(valid)
+                result[product_id] = (self.countries[row.index(lowest)], lowest)
+        return result
+
+    def cheapest_countries(self, product_id, n):
+        """[(country_code, USD price)] of the n cheapest countries of a product"""
+        row = self.row(product_id)
+        return nsmallest(n, ((country_code, value) for country_code, value in zip(self.countries, row)
+                             if value == value), key=lambda item: item[1])
+
+    def cheapest_products(self, country_code, n):
+        """[(product_id, USD price)] of the n cheapest products in a country"""
+        column = self.column(country_code)
+        return nsmallest(n, ((product_id, value) for product_id, value in zip(self.product_ids, column)
+                             if value == value), key=lambda item: item[1])
+
+    def statistics(self, percentiles=(50, 90)):
+        """{product_id: {'min', 'max', 'spread', 'p50', ...}} over every product"""
+        result = {}
+        for product_id in self.product_ids:
+            valid = sorted(value for value in self.row(product_id) if value == value)
+            if not valid:
+                continue
+            stats = {'min': valid[0], 'max': valid[-1], 'spread': valid[-1] - valid[0], 'countries': len(valid)}
+            for percent in percentiles:
+                stats[f'p{percent:g}'] = percentile(valid, percent)
+            result[product_id] = stats
+        return result
+
+
+def display_price(price, normalize=None):
+    """(value, currency) to show for a price, in USD when normalizing"""
+    if price.missing:
+        return "-", "(no answer in time)"
+    value, currency = (price.value_usd, "USD") if normalize else (price.value, price.currency)
+    return ("-" if value is None else value), (currency or "")
+
+
+class PriceRanking:
+    """The count cheapest prices seen so far, in display order
+
+    Prices can be added one by one as countries complete. Ties keep the
+    order of COUNTRIES, so the ranking does not depend on arrival order and
+    ends up the same as sort_prices over all prices.
+    """
+    _ORDER = {code: index for index, code in enumerate(COUNTRIES)}
+
+    def __init__(self, count=None, prices=()):
+        self.count = count
+        self._keys = []
+        self.prices = []
+        for price in prices:
+            self.add(price)
+
+    def add(self, price):
+        """Rank a new price; True if it is among the count cheapest"""
+        key = (price_rank(price), self._ORDER.get(price.country_code, len(self._ORDER)))
+        position = bisect_left(self._keys, key)
+        if self.count is not None and position >= self.count:
+            return False
+        self._keys.insert(position, key)
+        self.prices.insert(position, price)
+        if self.count is not None and len(self.prices) > self.count:
+            del self._keys[-1]
+            del self.prices[-1]
+        return True
+
+
+def format_ranking(prices, pretty=None, normalize=None, title=None):
+    """Output lines of ranked prices, as a table with pretty, under title if given"""
     if pretty:
         shift_country = 25
         shift_price = 10
-        header = f"{'Country':<{shift_country}} {'Price':<{shift_price}} {'Currency'}\n"
-        out_string += header
-        out_string += "-" * (len(header)-1)
-        for i, price in enumerate(sorted_prices):
-            if i == count:
-                break
-            out_string += f"\n{price.country_name:<{shift_country}} {price.value:<{shift_price}} {price.currency}"
+        header = f"{'Country':<{shift_country}} {'Price':<{shift_price}} {'Currency'}"
+        lines = [header, "-" * len(header)]
+        if title is not None:
+            lines.insert(0, title)
+        for price in prices:
+            value, currency = display_price(price, normalize)
+            lines.append(f"{price.country_name:<{shift_country}} {value:<{shift_price}} {currency}")
     else:
-        for i, price in enumerate(sorted_prices):
-            if i == count:
-                break
-            out_string += f"\n{price.country_name}: {price.value} {price.currency}"
-    print(out_string)
+        lines = ["" if title is None else title]
+        for price in prices:
+            value, currency = display_price(price, normalize)
+            lines.append(f"{price.country_name}: {value} {currency}")
+    return lines
+
+
+def out_result(prices, count, pretty=None, normalize=None, title=None):
+    ranking = PriceRanking(min(abs(count), len(prices)), prices)
+    print("\n".join(format_ranking(ranking.prices, pretty, normalize, title)))
+
+
+class LiveRanking:
+    """Keeps the current top prices on a terminal while countries complete
+
+    Redraws in place at most every interval seconds, with a progress line
+    under the ranking; finish() draws the final ranking like out_result.
+    """
+
+    def __init__(self, count, total, pretty=None, normalize=None, stream=None, interval=LIVE_INTERVAL):
+        self.ranking = PriceRanking(min(abs(count), total))
+        self.total = total
+        self.pretty = pretty
+        self.normalize = normalize
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.done = 0
+        self._drawn = 0
+        self._last_draw = 0.0
+
+    def add(self, product_id, price):
+        self.done += 1
+        self.ranking.add(price)
+        if time.monotonic() - self._last_draw >= self.interval:
+            self.draw(format_ranking(self.ranking.prices, self.pretty, self.normalize)
+                      + [f"({self.done}/{self.total} countries)"])
+
+    def draw(self, lines):
+        if self._drawn:
+            # Back to the first line of the previous drawing and clear everything below
+            self.stream.write(f"\x1b[{self._drawn}F\x1b[J")
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+        self._drawn = len(lines)
+        self._last_draw = time.monotonic()
+
+    def finish(self, prices):
+        ranking = PriceRanking(self.ranking.count, prices)
+        self.draw(format_ranking(ranking.prices, self.pretty, self.normalize))
 
 
-def fetch_wishlist(username, country_code):
-    """Fetch wishlist HTML for a specific user and country code"""
-    url = f'https://www.gog.com/u/{username}/wishlist'
-    headers = {
+def wishlist_url(username):
+    return f'https://www.gog.com/u/{username}/wishlist'
+
+
+def wishlist_headers(country_code):
+    return {
         'Cookie': f'gog_lc={country_code}_USD_en-US',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
 
-    req = urllib_request.Request(url, headers=headers)
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.html') as temp_file:
+
+def resolve_product_id(value):
+    """Product id of a gog.com game url, a gogdb.org product url or a plain id"""
+    value = value.strip()
+    if value.isdigit():
+        return value
+    if "gogdb.org" in value:
+        return value.rstrip("/").split("/")[-1]
+    return extract_product_id(value)
+
+
+def read_batch(path):
+    """Read product urls or ids, one per line, from path or stdin for '-'"""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def process_batch(entries, count, pretty=None, normalize=None, engine=None, summary=False, deadline=None):
+    """Check many products over one engine, printing each as soon as it is complete
+
+    Progress goes to stderr so stdout only holds results. Returns the
+    PriceMatrix of all products, printed as a summary table if asked. A
+    deadline in seconds bounds the price requests of the whole batch.
+    """
+    own_engine = engine is None
+    engine = engine or FetchEngine()
+    try:
+        futures = [engine.submit(entry, resolve_product_id, entry) for entry in entries]
+        product_ids = []
+        for entry, future in zip(entries, futures):
+            try:
+                product_ids.append(future.result())
+            except Exception as e:
+                logging.error(f"Could not resolve product id of {entry}: {e}")
+                print(f"Skipping {entry}: could not resolve product id", file=sys.stderr)
+        matrix = PriceMatrix(OrderedDict.fromkeys(product_ids))
+        total = len(matrix.product_ids)
+        for done, (product_id, prices) in enumerate(iter_prices(product_ids, engine=engine, deadline=deadline), 1):
+            matrix.set_prices(product_id, prices)
+            print(f"[{done}/{total}] product {product_id} done", file=sys.stderr)
+            out_result(prices, count, pretty, normalize, f"Product {product_id}:")
+            sys.stdout.flush()
+    finally:
+        if own_engine:
+            engine.shutdown()
+    if summary:
+        print_summary(matrix)
+    return matrix
+
+
+def print_summary(matrix):
+    """Print the cheapest country and price spread of every product in USD"""
+    minimums = matrix.minimums()
+    statistics = matrix.statistics()
+    header = f"{'Product':<12} {'Cheapest':<25} {'Min':>8} {'Median':>8} {'P90':>8} {'Max':>8} {'Spread':>8}"
+    print(f"\n{header}\n{'-' * len(header)}")
+    for product_id in matrix.product_ids:
+        if product_id not in minimums:
+            print(f"{product_id:<12} {'-':<25}")
+            continue
+        country_code, _ = minimums[product_id]
+        stats = statistics[product_id]
+        print(f"{product_id:<12} {COUNTRIES.get(country_code, country_code):<25} {stats['min']:>8.2f} "
+              f"{stats['p50']:>8.2f} {stats['p90']:>8.2f} {stats['max']:>8.2f} {stats['spread']:>8.2f}")
+
+
+def fetch_wishlist(username, country_code, dump_dir=None, deadline=None):
+    """Fetch wishlist HTML for a specific user and country code
+
+    The page is kept in memory. With dump_dir set, a copy is also written to
+    dump_dir/<username>_<country_code>.html for debugging.
+    """
+    try:
+        started = time.perf_counter()
+        with timed('wishlist', country_code):
+            body = get_transport().request(wishlist_url(username), wishlist_headers(country_code),
+                                           circuit=country_code, deadline=deadline).body
+        logging.info(f"Wishlist for {username} with country code {country_code}: "
+                     f"fetched {len(body)} bytes in {time.perf_counter() - started:.3f}s")
+    except Exception as e:
+        if not out_of_time(deadline):
+            logging.error(f"Error fetching wishlist: {e}")
+        return None
+
+    if dump_dir:
         try:
-            with urllib_request.urlopen(req) as response:
-                html_content = response.read().decode('utf-8')
-                temp_file.write(html_content.encode('utf-8'))
-                temp_filename = temp_file.name
+            started = time.perf_counter()
+            os.makedirs(dump_dir, exist_ok=True)
+            filename = os.path.join(dump_dir, f"{username}_{country_code}.html")
+            with open(filename, 'wb') as dump_file:
+                dump_file.write(body)
+            logging.info(f"Wishlist for {username} with country code {country_code}: "
+                         f"wrote {len(body)} bytes to {filename} in {time.perf_counter() - started:.3f}s")
+        except OSError as e:
+            logging.error(f"Error dumping wishlist: {e}")
+    return body.decode('utf-8')
 
-            logging.info(f"Wishlist for {username} with country code {country_code} saved to {temp_filename}")
-            return html_content, temp_filename
-        except Exception as e:
+
+def fetch_wishlist_data(username, country_code, deadline=None):
+    """Stream the wishlist page and return its gogData
+
+    Reading stops as soon as the gogData object is complete.
+    """
+    received = 0
+    extracting = 0.0
+
+    def counted(chunks):
+        nonlocal received, extracting
+        for chunk in chunks:
+            received += len(chunk)
+            # The time until the next chunk is asked for is spent by the scanner
+            resumed = time.perf_counter()
+            yield chunk
+            extracting += time.perf_counter() - resumed
+
+    try:
+        started = time.perf_counter()
+        with timed('wishlist', country_code):
+            with get_transport().stream(wishlist_url(username), wishlist_headers(country_code),
+                                        circuit=country_code, deadline=deadline) as chunks:
+                gog_data = extract_gog_data_stream(counted(chunks))
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.observe('extract', extracting, country_code)
+        logging.info(f"Wishlist for {username} with country code {country_code}: "
+                     f"read {received} bytes in {time.perf_counter() - started:.3f}s")
+        return gog_data
+    except Exception as e:
+        if not out_of_time(deadline):
             logging.error(f"Error fetching wishlist: {e}")
-            return None, None
+        return None
 
-def extract_gog_data(html_content):
-    """Extract gogData object from HTML content"""
+# What may precede and follow the gogData name in its assignment
+_GOG_DATA_PREFIX = re.compile(r'(?:window\.|var\s+)$')
+_GOG_DATA_ASSIGN = re.compile(r'\s*=\s*')
+# A closing brace followed by a semicolon, the likely end of the assignment
+_GOG_DATA_END = re.compile(r'\}\s*;')
+_JSON_DECODER = json.JSONDecoder()
+
+
+class GogDataScanner:
+    """Locate the gogData object in HTML fed chunk by chunk
+
+    feed() returns the parsed object as soon as its closing brace arrives, so
+    callers can stop reading the rest of the page. The object is matched with
+    JSONDecoder.raw_decode, which stops at the brace closing the object; it is
+    only attempted once a chunk contains a plausible end of the assignment.
+    """
+    # Characters kept between chunks so a marker or end split across them is found
+    CHUNK_OVERLAP = 256
+
+    def __init__(self):
+        self._pending = ''
+        self._buffer = None
+
+    def feed(self, chunk):
+        if self._buffer is None:
+            chunk = self._find_start(chunk)
+            if chunk is None:
+                return None
+            self._buffer = ''
+        start = max(len(self._buffer) - self.CHUNK_OVERLAP, 0)
+        self._buffer += chunk
+        if _GOG_DATA_END.search(self._buffer, start):
+            try:
+                return _JSON_DECODER.raw_decode(self._buffer)[0]
+            except ValueError:
+                # The candidate end was inside a string, wait for more data
+                pass
+        return None
+
+    def finish(self):
+        """Parse whatever was collected once the stream has ended"""
+        if self._buffer is None:
+            return None
+        return _JSON_DECODER.raw_decode(self._buffer)[0]
+
+    def _find_start(self, chunk):
+        text = self._pending + chunk
+        pos = 0
+        while True:
+            # str.find is much faster than a regex starting with an alternation
+            pos = text.find('gogData', pos)
+            if pos < 0:
+                self._pending = text[-self.CHUNK_OVERLAP:]
+                return None
+            start = pos
+            pos += len('gogData')
+            if not _GOG_DATA_PREFIX.search(text, max(start - self.CHUNK_OVERLAP, 0), start):
+                continue
+            match = _GOG_DATA_ASSIGN.match(text, pos)
+            if match is None:
+                continue
+            if match.end() == len(text):
+                # The assignment may continue in the next chunk
+                self._pending = text[max(start - self.CHUNK_OVERLAP, 0):]
+                return None
+            if text[match.end()] == '{':
+                self._pending = ''
+                return text[match.end():]
+
+
+def extract_gog_data_stream(chunks):
+    """Extract gogData from an iterable of HTML chunks (str or bytes)
+
+    Stops consuming chunks as soon as the object is complete.
+    """
+    scanner = GogDataScanner()
+    decoder = codecs.getincrementaldecoder('utf-8')()
     try:
-        # Find the gogData object in the HTML
-        match = re.search(r'window\.gogData\s*=\s*(\{.*?\});\s*window\.', html_content, re.DOTALL)
-        if match:
-            gog_data_str = match.group(1)
-            # Parse the JSON data
-            gog_data = json.loads(gog_data_str)
-            return gog_data
-        else:
-            # Alternative approach if the first pattern doesn't match
-            match = re.search(r'var gogData\s*=\s*(\{.*?\});\s*', html_content, re.DOTALL)
-            if match:
-                gog_data_str = match.group(1)
-                gog_data = json.loads(gog_data_str)
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk)
+            gog_data = scanner.feed(chunk)
+            if gog_data is not None:
                 return gog_data
-
+        gog_data = scanner.finish()
+        if gog_data is None:
             logging.error("Could not find gogData in HTML")
-            return None
+        return gog_data
     except Exception as e:
         logging.error(f"Error extracting gogData: {e}")
         return None
 
-def process_wishlist(username, normalize=False):
-    """Process wishlist for all countries and find the best prices"""
-    # Dictionary to store product prices: {product_name: {country_code: {price, currency}}}
-    product_prices = {}
 
-    # Process each country
-    for country_code, country_name in COUNTRIES.items():
-        logging.info(f"Processing country: {country_name} ({country_code})")
+def extract_gog_data(html_content):
+    """Extract gogData object from HTML content"""
+    return extract_gog_data_stream((html_content,))
+
+
+def fetch_wishlist_page(username, country_code, page=1, deadline=None):
+    """Fetch one page of the wishlist JSON listing, or None if it is unavailable"""
+    url = WISHLIST_API_URL.format(username=username, page=page)
+    try:
+        data = json_loads(get_transport().request(url, wishlist_headers(country_code), circuit=country_code,
+                                                  deadline=deadline).body)
+    except Exception as e:
+        if out_of_time(deadline):
+            logging.debug(f"No time left for wishlist page {page} for {country_code}: {e}")
+        else:
+            logging.warning(f"Error fetching wishlist page {page} for {country_code}: {e}")
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('products'), list):
+        logging.warning(f"Unexpected wishlist page {page} for {country_code}")
+        return None
+    return data
+
+
+def wishlist_total_pages(data):
+    try:
+        return max(int(data.get('totalPages') or 1), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def iter_wishlist_products(username, country_code, engine, deadline=None):
+    """Yield the wishlist product records of one country as its pages arrive
+
+    The first page tells how many pages there are; the rest are then requested
+    concurrently on engine and their records yielded in page order. Falls back
+    to scraping gogData from the wishlist HTML when the JSON listing is
+    unavailable. Raises DeadlineExceeded when deadline (a time.monotonic()
+    value) passes before the listing is complete. Must not be called from a
+    worker of engine.
+    """
+    def result(future):
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            data = future.result(timeout)
+        except FuturesTimeoutError:
+            data = None
+        except Exception as e:
+            logging.error(f"Error fetching wishlist for {country_code}: {e}")
+            data = None
+        if data is None and out_of_time(deadline):
+            raise DeadlineExceeded(f"wishlist of {username} not listed before the deadline")
+        return data
+
+    url = WISHLIST_API_URL.format(username=username, page=1)
+    futures = [engine.submit(url, fetch_wishlist_page, username, country_code, 1, deadline)]
+    try:
+        first = result(futures[0])
+        if first is None:
+            logging.info(f"Falling back to the wishlist page for {country_code}")
+            futures.append(engine.submit(wishlist_url(username), fetch_wishlist_data,
+                                         username, country_code, deadline))
+            yield from (result(futures[-1]) or {}).get('products') or []
+            return
+        futures += [engine.submit(url, fetch_wishlist_page, username, country_code, page, deadline)
+                    for page in range(2, wishlist_total_pages(first) + 1)]
+        yield from first['products']
+        for future in futures[1:]:
+            data = result(future)
+            if data is not None:
+                yield from data['products']
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def wishlist_country_prices(username, country_code, country_name, dump_dir=None, deadline=None):
+    """Fetch and parse the wishlist HTML for one country
+
+    Returns the gogData product records in wishlist order.
+    """
+    logging.info(f"Processing country: {country_name} ({country_code})")
 
-        # Fetch wishlist for this country
-        html_content, temp_filename = fetch_wishlist(username, country_code)
+    if dump_dir:
+        # Dumping needs the whole page, so fetch it before extracting gogData
+        html_content = fetch_wishlist(username, country_code, dump_dir, deadline)
         if not html_content:
-            continue
+            return []
+        with timed('extract', country_code):
+            gog_data = extract_gog_data(html_content)
+    else:
+        gog_data = fetch_wishlist_data(username, country_code, deadline)
+    if not gog_data or 'products' not in gog_data:
+        return []
+    return gog_data['products']
 
-        # Extract gogData
-        gog_data = extract_gog_data(html_content)
-        if not gog_data or 'products' not in gog_data:
-            # Clean up temp file
-            if temp_filename and os.path.exists(temp_filename):
-                os.unlink(temp_filename)
-            continue
 
-        # Process products
-        for product in gog_data['products']:
-            product_id = product.get('id')
-            product_title = product.get('title')
+def wishlist_product_price(product):
+    """(amount, currency) of a wishlist product record, None if it has no price"""
+    # Get price information
+    price_info = product.get('price')
+    if not price_info:
+        return None
 
-            if not product_id or not product_title:
-                continue
+    # Handle different price formats
+    amount = None
+    currency = 'USD'  # Default currency
 
-            # Get price information
-            price_info = product.get('price')
-            if not price_info:
-                continue
+    if isinstance(price_info, dict):
+        amount = price_info.get('amount')
 
-            # Handle different price formats
-            amount = None
-            currency = 'USD'  # Default currency
-
-            if isinstance(price_info, dict):
-                amount = price_info.get('amount')
-
-                # Handle currency which could be a string or a dict
-                curr_info = price_info.get('currency')
-                if isinstance(curr_info, dict):
-                    currency = curr_info.get('code', 'USD')
-                elif isinstance(curr_info, str):
-                    currency = curr_info
-            elif isinstance(price_info, str):
-                # Sometimes price might be directly a string like "19.99 USD"
-                parts = price_info.split(' ')
-                if len(parts) >= 2:
-                    try:
-                        amount = parts[0]
-                        currency = parts[1]
-                    except (IndexError, ValueError):
-                        logging.warning(f"Could not parse price string: {price_info}")
-                        continue
+        # Handle currency which could be a string or a dict
+        curr_info = price_info.get('currency')
+        if isinstance(curr_info, dict):
+            currency = curr_info.get('code', 'USD')
+        elif isinstance(curr_info, str):
+            currency = curr_info
+    elif isinstance(price_info, str):
+        # Sometimes price might be directly a string like "19.99 USD"
+        parts = price_info.split(' ')
+        if len(parts) >= 2:
+            amount = parts[0]
+            currency = parts[1]
 
-            if amount is None:
-                continue
+    if amount is None:
+        return None
+    return amount, currency
 
-            # Initialize product in dictionary if not exists
-            if product_title not in product_prices:
-                product_prices[product_title] = {}
 
-            # Store price information
-            product_prices[product_title][country_code] = {
-                'country_code': country_code,
-                'country_name': country_name,
-                'price': amount,
-                'currency': currency
-            }
+class BestPrice:
+    """Cheapest price of one wishlist product seen so far"""
+    __slots__ = ('product_id', 'title', 'order', 'country_index', 'price', 'currency', 'amount', 'price_usd')
 
-        # Clean up temp file
-        if temp_filename and os.path.exists(temp_filename):
-            os.unlink(temp_filename)
+    def __init__(self, product_id, title, order):
+        self.product_id = product_id
+        self.title = title
+        # Where the product was first seen, so results keep wishlist order
+        self.order = order
+        self.country_index = None
+        self.price = None
+        self.currency = None
+        self.amount = None
+        self.price_usd = None
 
-    # Find the best price for each product
-    best_prices = {}
-    for product_name, country_prices in product_prices.items():
-        if not country_prices:
-            continue
+    def rank(self):
+        # Prices in a currency without a known rate can't be compared in USD, rank them last
+        return (self.price_usd is None, self.price_usd or self.amount, self.country_index)
+
+
+class WishlistPrices:
+    """Streaming reduction of wishlist prices to the cheapest country per product
 
-        # Find the lowest price
-        lowest_price = None
-        lowest_country = None
+    Prices are folded in as each country answers, keeping one BestPrice per
+    product id, so same-named products never collide and nothing else is
+    held. With keep_matrix, every country's price is also kept in arrays
+    indexed by country, for the price history.
+    """
 
-        for country_code, price_data in country_prices.items():
-            price = price_data['price']
+    def __init__(self, countries=None, keep_matrix=False):
+        self.countries = list((COUNTRIES if countries is None else countries).items())
+        self._index = {country_code: index for index, (country_code, _) in enumerate(self.countries)}
+        self._best = {}
+        # product_id -> (values, values in USD, currencies), NaN/None where unknown
+        self.matrix = {} if keep_matrix else None
 
-            # Convert to float for comparison
+    def __len__(self):
+        return len(self._best)
+
+    def add(self, country_code, products):
+        """Fold the wishlist product records of one country in"""
+        index = self._index[country_code]
+        offers = []
+        for position, product in enumerate(products):
+            product_id = product.get('id')
+            title = product.get('title')
+            if not product_id or not title:
+                continue
+            price = wishlist_product_price(product)
+            if price is None:
+                continue
             try:
-                price_value = float(price)
+                amount = float(price[0])
             except (ValueError, TypeError):
                 continue
+            offers.append((str(product_id), title, position, price[0], price[1], amount))
+        # Convert the page to USD in one pass so countries compare correctly
+        converted = get_fx().to_usd([offer[5] for offer in offers], [offer[4] for offer in offers])
+        for (product_id, title, position, price, currency, amount), price_usd in zip(offers, converted):
+            self.offer(product_id, title, (index, position), index, price, currency, amount,
+                       None if price_usd is None else round(price_usd, 2))
+
+    def offer(self, product_id, title, order, country_index, price, currency, amount, price_usd):
+        """Keep the price of one product in one country if it is the cheapest yet"""
+        best = self._best.get(product_id)
+        if best is None:
+            best = self._best[product_id] = BestPrice(product_id, title, order)
+        else:
+            best.order = min(best.order, order)
+        if best.country_index is None or \
+                (price_usd is None, price_usd or amount, country_index) < best.rank():
+            best.country_index = country_index
+            best.price, best.currency, best.amount, best.price_usd = price, currency, amount, price_usd
+        if self.matrix is not None:
+            row = self.matrix.get(product_id)
+            if row is None:
+                row = self.matrix[product_id] = (array('d', [math.nan]) * len(self.countries),
+                                                 array('d', [math.nan]) * len(self.countries),
+                                                 [None] * len(self.countries))
+            row[0][country_index] = amount
+            row[1][country_index] = math.nan if price_usd is None else price_usd
+            row[2][country_index] = currency
+
+    def best_prices(self):
+        """{product_id: price_data} of the cheapest country of every product, in wishlist order"""
+        best_prices = OrderedDict()
+        for best in sorted(self._best.values(), key=lambda best: best.order):
+            country_code, country_name = self.countries[best.country_index]
+            best_prices[best.product_id] = {
+                'product_id': best.product_id,
+                'title': best.title,
+                'country_code': country_code,
+                'country_name': country_name,
+                'price': best.price,
+                'currency': best.currency,
+                'price_usd': best.price_usd,
+            }
+        return best_prices
 
-            if lowest_price is None or price_value < lowest_price:
-                lowest_price = price_value
-                lowest_country = country_code
+    def record_history(self):
+        """Append the kept matrix to the price history, if it is enabled"""
+        history = get_history()
+        if history is None or self.matrix is None:
+            return
+        for product_id, (values, values_usd, currencies) in self.matrix.items():
+            prices = []
+            for (country_code, country_name), value, value_usd, currency in \
+                    zip(self.countries, values, values_usd, currencies):
+                if math.isnan(value):
+                    continue
+                price = Price(country_code, country_name)
+                price.value = value
+                price.currency = currency
+                price.value_usd = None if math.isnan(value_usd) else value_usd
+                prices.append(price)
+            try:
+                history.append(product_id, prices)
+            except (OSError, ValueError) as e:
+                logging.error(f"Error recording price history: {e}")
 
-        if lowest_country:
-            best_prices[product_name] = country_prices[lowest_country]
 
+def process_wishlist(username, normalize=False, engine=None, dump_dir=None, deadline=None, missing=None):
+    """Process wishlist for all countries and find the best prices
+
+    The wishlist is fetched once to learn which products are on it, then their
+    prices are requested by product id like single product checks, sharing
+    the price cache, price regions and history. With dump_dir the wishlist
+    page of every country is scraped instead, so the pages can be saved.
+
+    With a deadline in seconds, countries that have not answered by then are
+    skipped; their codes are appended to the missing list if one is given.
+    """
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    own_engine = engine is None
+    engine = engine or FetchEngine()
+    try:
+        if dump_dir:
+            best_prices, skipped = wishlist_prices_by_page(username, engine, dump_dir, deadline_at)
+        else:
+            best_prices, skipped = wishlist_prices_by_id(username, engine, deadline_at)
+    finally:
+        if own_engine:
+            engine.shutdown()
+    if skipped:
+        logging.warning(f"Wishlist for {username}: no answer before the deadline from "
+                        f"{len(skipped)} of {len(COUNTRIES)} countries: {', '.join(skipped)}")
+        if missing is not None:
+            missing.extend(skipped)
     return best_prices
 
-def display_best_prices(best_prices, pretty=False):
+
+def wishlist_prices_by_id(username, engine, deadline=None):
+    """Best price of every wishlist product, priced through the price API
+
+    Returns (best_prices, skipped_country_codes).
+    """
+    products = OrderedDict()
+    position = {}
+    listed = [True]
+
+    def product_ids():
+        # Products are handed to the price checks while later pages are still coming
+        try:
+            for product in iter_wishlist_products(username, WISHLIST_COUNTRY, engine, deadline):
+                product_id = str(product.get('id') or '')
+                if product_id and product.get('title') and product_id not in products:
+                    products[product_id] = product
+                    position[product_id] = len(position)
+                    yield product_id
+        except DeadlineExceeded as e:
+            logging.warning(f"Wishlist listing incomplete: {e}")
+            listed[0] = False
+
+    # iter_prices records the history, only the cheapest country is kept here
+    aggregate = WishlistPrices()
+    skipped = set()
+    remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+    for product_id, prices in iter_prices(product_ids(), engine=engine, deadline=remaining):
+        title = products[product_id]['title']
+        for index, price in enumerate(prices):
+            if price.missing:
+                skipped.add(price.country_code)
+            elif price.value is not None:
+                aggregate.offer(product_id, title, (0, position[product_id]), index, f"{price.value:.2f}",
+                                price.currency, price.value,
+                                None if price.value_usd is None else round(price.value_usd, 2))
+    if not listed[0]:
+        # Products missing from the listing were never priced in any country
+        return aggregate.best_prices(), list(COUNTRIES)
+    return aggregate.best_prices(), [country_code for country_code in COUNTRIES if country_code in skipped]
+
+
+def wishlist_prices_by_page(username, engine, dump_dir=None, deadline=None):
+    """Best price of every wishlist product, read from each country's wishlist
+
+    Each country's page is reduced into the running best prices as soon as it
+    arrives. Returns (best_prices, skipped_country_codes).
+    """
+    aggregate = WishlistPrices(keep_matrix=get_history() is not None)
+    futures = {engine.submit(wishlist_url(username), wishlist_country_prices,
+                             username, country_code, country_name, dump_dir, deadline): country_code
+               for country_code, country_name in COUNTRIES.items()}
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            aggregate.add(futures[future], future.result())
+            futures[future] = None
+    except FuturesTimeoutError:
+        pass
+    skipped = []
+    for future, country_code in futures.items():
+        if country_code is not None:
+            future.cancel()
+            skipped.append(country_code)
+    aggregate.record_history()
+    return aggregate.best_prices(), skipped
+
+def wishlist_display_price(price_data, normalize=False):
+    if normalize and price_data.get('price_usd') is not None:
+        return price_data['price_usd'], 'USD'
+    return price_data['price'], price_data['currency']
+
+
+def display_best_prices(best_prices, pretty=False, normalize=False):
     """Display the best prices for each product"""
     if not best_prices:
         print("No products found in wishlist or prices could not be determined.")
@@ -343,7 +2650,7 @@ def display_best_prices(best_prices, pretty=False):
 
     if pretty:
         # Pretty table format
-        product_width = max(len(product) for product in best_prices.keys()) + 2
+        product_width = max(len(price_data['title']) for price_data in best_prices.values()) + 2
         price_width = 10
         currency_width = 8
         # country_width is not used in the formatting below
@@ -352,40 +2659,491 @@ def display_best_prices(best_prices, pretty=False):
         print(header)
         print("-" * len(header))
 
-        for product, price_data in best_prices.items():
-            print(f"{product:<{product_width}} {price_data['price']:<{price_width}} {price_data['currency']:<{currency_width}} {price_data['country_name']}")
+        for price_data in best_prices.values():
+            price, currency = wishlist_display_price(price_data, normalize)
+            print(f"{price_data['title']:<{product_width}} {price:<{price_width}} {currency:<{currency_width}} {price_data['country_name']}")
     else:
         # Simple format
-        for product, price_data in best_prices.items():
-            print(f"{product} - {price_data['price']} {price_data['currency']} - {price_data['country_name']}")
+        for price_data in best_prices.values():
+            price, currency = wishlist_display_price(price_data, normalize)
+            print(f"{price_data['title']} - {price} {currency} - {price_data['country_name']}")
+
+def price_record(price):
+    return {
+        'country_code': price.country_code,
+        'country_name': price.country_name,
+        'currency': price.currency,
+        'value': price.value,
+        'value_usd': price.value_usd,
+        'missing': price.missing,
+    }
+
+
+class Coalescer:
+    """Share one in-flight computation among concurrent callers of the same key"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._inflight = {}
+
+    def run(self, key, fn, *args):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+class PriceService:
+    """Price and wishlist lookups for the serve mode
+
+    Results are kept in memory for ttl seconds and concurrent lookups of the
+    same product or wishlist share a single upstream fan-out. Lookups with a
+    deadline return partial results, which are not kept.
+    """
+
+    def __init__(self, engine, ttl=SERVE_CACHE_TTL, max_entries=SERVE_CACHE_MAX_ENTRIES, deadline=None):
+        self.engine = engine
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.deadline = deadline
+        self._coalescer = Coalescer()
+        self._results = OrderedDict()
+        self._lock = Lock()
+
+    def prices(self, product_id, deadline=None):
+        deadline = deadline or self.deadline
+        return self._cached(('prices', product_id, deadline), self._fetch_prices, product_id, deadline)
+
+    def wishlist(self, username, deadline=None):
+        deadline = deadline or self.deadline
+        return self._cached(('wishlist', username, deadline), self._fetch_wishlist, username, deadline)
+
+    def _fetch_prices(self, product_id, deadline):
+        prices = sort_prices(request_prices(product_id, self.engine, deadline=deadline))
+        return {'product_id': product_id, 'prices': [price_record(price) for price in prices],
+                'missing_countries': [price.country_code for price in prices if price.missing]}
+
+    def _fetch_wishlist(self, username, deadline):
+        missing = []
+        best_prices = process_wishlist(username, engine=self.engine, deadline=deadline, missing=missing)
+        return {'username': username, 'best_prices': best_prices, 'missing_countries': missing}
+
+    def _cached(self, key, fn, *args):
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > time.time():
+                self._results.move_to_end(key)
+                return cached[1]
+        result = self._coalescer.run(key, fn, *args)
+        if result['missing_countries']:
+            return result
+        with self._lock:
+            self._results[key] = (time.time() + self.ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
+
+
+class PriceRequestHandler(BaseHTTPRequestHandler):
+    """Serves GET /prices/{product_id} and GET /wishlist/{user} as JSON"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        segments = [segment for segment in parts.path.split('/') if segment]
+        service = self.server.service
+        try:
+            deadline = parse_qs(parts.query).get('deadline', [None])[0]
+            deadline = float(deadline) if deadline else None
+        except ValueError:
+            return self.send_json(400, {'error': 'deadline must be a number of seconds'})
+        try:
+            if len(segments) == 2 and segments[0] == 'prices':
+                if not segments[1].isdigit():
+                    return self.send_json(400, {'error': 'product id must be numeric'})
+                return self.send_json(200, service.prices(segments[1], deadline))
+            if len(segments) == 2 and segments[0] == 'wishlist':
+                return self.send_json(200, service.wishlist(segments[1], deadline))
+            if segments == ['metrics'] and get_metrics() is not None:
+                return self.send_text(200, get_metrics().prometheus())
+            return self.send_json(404, {'error': 'not found'})
+        except Exception as e:
+            logging.error(f"Error serving {self.path}: {e}")
+            return self.send_json(502, {'error': str(e)})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+class PriceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, PriceRequestHandler)
+        self.service = service
+
+
+def serve(host, port, engine, ttl=SERVE_CACHE_TTL, deadline=None):
+    """Run the JSON price service until interrupted"""
+    server = PriceServer((host, port), PriceService(engine, ttl, deadline=deadline))
+    logging.info(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class WatchState:
+    """Last known prices and polling schedule of watched products, kept in SQLite"""
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'watch.sqlite3')
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS watch_prices (
+            product_id TEXT NOT NULL,
+            country_code TEXT NOT NULL,
+            currency TEXT,
+            value REAL,
+            value_usd REAL,
+            PRIMARY KEY (product_id, country_code))""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS watch_schedule (
+            product_id TEXT PRIMARY KEY,
+            interval REAL NOT NULL,
+            next_poll REAL NOT NULL)""")
+
+    def schedule(self, product_id):
+        """(interval, next_poll) of a product, or None if it was never polled"""
+        return self._db.execute("SELECT interval, next_poll FROM watch_schedule WHERE product_id = ?",
+                                (product_id,)).fetchone()
+
+    def last_prices(self, product_id):
+        rows = self._db.execute("SELECT country_code, currency, value, value_usd FROM watch_prices "
+                                "WHERE product_id = ?", (product_id,))
+        return {row[0]: row[1:] for row in rows}
+
+    def update(self, product_id, prices, interval, next_poll):
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO watch_prices VALUES (?, ?, ?, ?, ?)",
+                [(product_id, price.country_code, price.currency, price.value, price.value_usd)
+                 for price in prices if price.value is not None])
+            self._db.execute("INSERT OR REPLACE INTO watch_schedule VALUES (?, ?, ?)",
+                             (product_id, interval, next_poll))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self._db.close()
+
+
+def price_changes(product_id, previous, prices, threshold=0.0, below=None):
+    """Compare fresh prices with the last known ones
+
+    Returns (events, changed): events for drops of at least threshold percent
+    and for prices crossing below the USD limit, and whether anything moved.
+    """
+    events = []
+    changed = False
+    for price in prices:
+        if price.value is None:
+            continue
+        last = previous.get(price.country_code)
+        if last is None:
+            continue
+        last_currency, last_value, last_value_usd = last
+        if last_currency != price.currency or last_value != price.value:
+            changed = True
+        if last_currency == price.currency and last_value and price.value < last_value:
+            drop = (last_value - price.value) / last_value * 100
+            if drop >= threshold:
+                events.append(dict(price_record(price), event='drop', product_id=product_id,
+                                   previous=last_value, drop_percent=round(drop, 2)))
+        if (below is not None and price.value_usd is not None and price.value_usd <= below
+                and (last_value_usd is None or last_value_usd > below)):
+            events.append(dict(price_record(price), event='below', product_id=product_id, limit=below))
+    return events, changed
+
+
+def emit_events(events, webhook=None):
+    """Print events as JSON lines, or POST them as a JSON list to webhook"""
+    if not events:
+        return
+    if webhook:
+        body = json.dumps(events).encode('utf-8')
+        request = urllib_request.Request(webhook, body, {'Content-Type': 'application/json'}, method='POST')
+        try:
+            urllib_request.urlopen(request, timeout=REQUEST_TIMEOUT).close()
+        except Exception as e:
+            logging.error(f"Error posting to webhook: {e}")
+        return
+    for event in events:
+        print(json.dumps(event))
+    sys.stdout.flush()
+
+
+def watch(product_ids, state, engine, interval=WATCH_INTERVAL, min_interval=WATCH_MIN_INTERVAL,
+          max_interval=WATCH_MAX_INTERVAL, threshold=0.0, below=None, webhook=None, once=False):
+    """Re-poll products when they are due and emit only price changes
+
+    A product whose price moved is polled twice as often, down to
+    min_interval; a stable one backs off to twice its interval, up to
+    max_interval. With once set, a single cycle runs.
+    """
+    if not product_ids:
+        logging.error("Nothing to watch: the watchlist is empty")
+        return
+    while True:
+        now = time.time()
+        due = []
+        for product_id in product_ids:
+            schedule = state.schedule(product_id)
+            if schedule is None or schedule[1] <= now:
+                due.append(product_id)
+        logging.info(f"Polling {len(due)} of {len(product_ids)} watched products")
+        for product_id, prices in iter_prices(due, engine=engine):
+            schedule = state.schedule(product_id)
+            previous = state.last_prices(product_id)
+            events, changed = price_changes(product_id, previous, prices, threshold, below)
+            emit_events(events, webhook)
+            if schedule is None:
+                next_interval = interval
+            elif changed:
+                next_interval = max(schedule[0] / 2, min_interval)
+            else:
+                next_interval = min(schedule[0] * 2, max_interval)
+            state.update(product_id, prices, next_interval, time.time() + next_interval)
+        if once:
+            return
+        next_polls = [state.schedule(product_id)[1] for product_id in product_ids]
+        time.sleep(max(min(next_polls) - time.time(), 1))
+
+
+def show_history(history, product_id, days=None, country_code=None, count=10):
+    since = time.time() - days * 24 * 60 * 60 if days else None
+    lowest = history.lowest(product_id, country_code, since)
+    if lowest is None:
+        print(f"No price history for product {product_id}")
+        return
+    timestamp, _, lowest_country, currency, value, value_usd = lowest
+    print(f"Lowest price of product {product_id}: {COUNTRIES.get(lowest_country, lowest_country)}: "
+          f"{value} {currency} ({value_usd} USD) on {time.strftime('%Y-%m-%d', time.localtime(timestamp))}")
+    if country_code is None:
+        period = f"last {days:g} days" if days else "all time"
+        print(f"Cheapest countries ({period}):")
+        for country, value_usd in history.cheapest_countries(product_id, since)[:count]:
+            print(f"{COUNTRIES.get(country, country)}: {value_usd} USD")
+
 
 def main():
     args = init_parser().parse_args()
+    if args.profile or args.metrics or args.command == 'serve':
+        # A server always collects them for its /metrics endpoint
+        set_metrics(Metrics())
+    if not args.no_cache:
+        try:
+            # Watching is about noticing changes, so cached prices are always revalidated
+            set_cache(Cache(ttl=args.cache_ttl, refresh=args.refresh or args.command == 'watch'))
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Price cache disabled: {e}")
+    transport = get_transport()
+    transport.timeout = args.timeout
+    transport.retries = args.retries
+    transport.limiter = RateLimiter(args.rate, max_inflight=args.workers)
+    if args.fx_rates:
+        set_fx(FxRates.from_file(args.fx_rates))
+    elif args.command != 'history':
+        set_fx(FxRates.load(ttl=args.fx_ttl))
+    if args.regions:
+        set_regions(PriceRegions.from_file(args.regions))
+    elif not args.all_countries:
+        set_regions(PriceRegions.load())
+    if not args.no_history:
+        try:
+            set_history(PriceHistory())
+        except OSError as e:
+            logging.warning(f"Price history disabled: {e}")
+    if args.seed_slugs:
+        if get_cache() is None:
+            logging.warning("--seed-slugs needs the cache, ignoring it")
+        else:
+            pairs = load_slug_catalog(args.seed_slugs)
+            get_cache().put_product_ids(pairs)
+            logging.info(f"Seeded {len(pairs)} product ids from {args.seed_slugs}")
 
-    if args.wishlist:
-        logging.info(f"Fetching wishlist for user: {args.wishlist}")
-        best_prices = process_wishlist(args.wishlist, args.normalize)
-        display_best_prices(best_prices, args.pretty)
-    elif args.url:
-        if "gogdb.org" in args.url:
-            product_id = args.url.split("/")[-1]
+    try:
+        if args.command == 'history':
+            history = get_history()
+            if history is None:
+                history = PriceHistory()
+            show_history(history, resolve_product_id(args.product), args.days, args.country, args.count)
+        elif args.command == 'watch':
+            product_ids = list(OrderedDict.fromkeys(resolve_product_id(entry) for entry in read_batch(args.file)))
+            state = WatchState()
+            try:
+                with FetchEngine(args.workers, args.per_host) as engine:
+                    watch(product_ids, state, engine, args.interval, args.min_interval, args.max_interval,
+                          args.threshold, args.below, args.webhook, args.once)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                state.close()
+        elif args.command == 'serve':
+            with FetchEngine(args.workers, args.per_host) as engine:
+                serve(args.host, args.port, engine, args.ttl, args.deadline)
+        elif args.wishlist:
+            logging.info(f"Fetching wishlist for user: {args.wishlist}")
+            with FetchEngine(args.workers, args.per_host) as engine:
+                best_prices = process_wishlist(args.wishlist, args.normalize, engine, args.dump_html, args.deadline)
+            display_best_prices(best_prices, args.pretty, args.normalize)
+        elif args.batch:
+            with FetchEngine(args.workers, args.per_host) as engine:
+                process_batch(read_batch(args.batch), args.count, args.pretty, args.normalize, engine,
+                              args.summary, args.deadline)
+        elif args.url:
+            product_id = resolve_product_id(args.url)
+            if args.live and sys.stdout.isatty():
+                live = LiveRanking(args.count, len(COUNTRIES), args.pretty, args.normalize)
+                with FetchEngine(args.workers, args.per_host) as engine:
+                    prices = request_prices(product_id, engine, live.add, args.deadline)
+                live.finish(prices)
+            else:
+                with FetchEngine(args.workers, args.per_host) as engine:
+                    prices = request_prices(product_id, engine, deadline=args.deadline)
+                out_result(prices, args.count, args.pretty, args.normalize)
         else:
-            product_id = extract_product_id(args.url)
-        request_prices(product_id, args.normalize)
-        sort_prices()
-        out_result(args.count, args.pretty)
-    else:
-        print("Please provide either a URL (-u) or a wishlist username (-w)")
+            print("Please provide either a URL (-u), a batch file (--batch) or a wishlist username (-w)")
+    finally:
+        set_cache(None)
+        set_history(None)
+        set_fx(None)
+        regions = get_regions()
+        if regions is not None:
+            regions.save()
+        set_regions(None)
+        metrics = get_metrics()
+        set_metrics(None)
+        if metrics is not None and args.profile:
+            print(metrics.summary(), file=sys.stderr)
+        if metrics is not None and args.metrics:
+            try:
+                with open(args.metrics, 'w', encoding='utf-8') as f:
+                    f.write(metrics.prometheus())
+            except OSError as e:
+                logging.error(f"Error writing metrics: {e}")
 
 
 def init_parser():
     parser = ArgumentParser()
     parser.add_argument("-u", "--url", type=str, help="url to scrape")
+    parser.add_argument("--summary", action="store_true",
+                        help="with --batch, end with the cheapest country and price spread of every product")
     parser.add_argument("-n", "--normalize", action="store_true", help="normalize currencies to USD")
+    parser.add_argument("--fx-rates", metavar="FILE", type=str,
+                        help="use the exchange rates in FILE (JSON, units per USD) instead of the cached snapshot")
+    parser.add_argument("--fx-ttl", type=int, default=FX_TTL,
+                        help=f"seconds before the exchange rate snapshot is refreshed (default: {FX_TTL})")
     parser.add_argument("-c", "--count", type=int, default=10, help="number of countries to show")
     parser.add_argument("-p", "--pretty", action="store_true", help="shows result as pretty table")
+    parser.add_argument("--live", action="store_true",
+                        help="on a terminal, show the cheapest countries so far while prices come in")
     parser.add_argument("-w", "--wishlist", type=str, help="username to fetch wishlist for")
+    parser.add_argument("-b", "--batch", metavar="FILE", type=str,
+                        help="check every url or product id listed in FILE, one per line ('-' for stdin)")
     parser.add_argument("-v", "--verbose", action="store_true", help="enable verbose logging")
+    parser.add_argument("--dump-html", metavar="DIR", type=str,
+                        help="write fetched wishlist pages to DIR for debugging")
+    parser.add_argument("-j", "--workers", type=int, default=MAX_WORKERS,
+                        help=f"maximum number of concurrent requests (default: {MAX_WORKERS})")
+    parser.add_argument("--per-host", type=int, default=MAX_CONNECTIONS_PER_HOST,
+                        help=f"maximum concurrent requests per host (default: {MAX_CONNECTIONS_PER_HOST})")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT,
+                        help=f"maximum sustained requests per second (default: {RATE_LIMIT})")
+    parser.add_argument("--retries", type=int, default=RETRIES,
+                        help=f"retries of a request failing with 429/5xx or a timeout (default: {RETRIES})")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="stop waiting for prices after SECONDS and show what arrived, "
+                             "marking countries without an answer")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help=f"seconds to wait for a single response (default: {REQUEST_TIMEOUT})")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the price cache")
+    parser.add_argument("--refresh", action="store_true", help="revalidate cached prices with the API")
+    parser.add_argument("--cache-ttl", type=int, default=CACHE_TTL,
+                        help=f"seconds cached prices are used without asking the API (default: {CACHE_TTL})")
+    parser.add_argument("--no-history", action="store_true", help="do not record prices in the price history")
+    parser.add_argument("--seed-slugs", metavar="FILE", type=str,
+                        help="load game slug to product id mappings from a catalog dump")
+    parser.add_argument("--regions", metavar="FILE", type=str,
+                        help="query one country per price region listed in FILE (JSON list of country code lists)")
+    parser.add_argument("--all-countries", action="store_true",
+                        help="query every country instead of one per learned price region")
+    parser.add_argument("--profile", action="store_true",
+                        help="print p50/p95/p99 timings per phase and the slowest countries to stderr")
+    parser.add_argument("--metrics", metavar="FILE", type=str,
+                        help="write timings and counters to FILE in the Prometheus text format")
+
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="serve prices and wishlists as JSON over HTTP")
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1", help="address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    serve_parser.add_argument("--ttl", type=int, default=SERVE_CACHE_TTL,
+                              help=f"seconds results are kept in memory (default: {SERVE_CACHE_TTL})")
+    history_parser = commands.add_parser("history", help="query the recorded price history of a product")
+    history_parser.add_argument("product", type=str, help="game url or product id")
+    history_parser.add_argument("--days", type=float, help="only consider the last DAYS days")
+    history_parser.add_argument("--country", type=str, help="only consider this country code")
+    watch_parser = commands.add_parser("watch", help="re-poll a watchlist and report price drops")
+    watch_parser.add_argument("file", type=str, help="watchlist of urls or product ids, one per line ('-' for stdin)")
+    watch_parser.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                              help=f"initial seconds between polls of a product (default: {WATCH_INTERVAL})")
+    watch_parser.add_argument("--min-interval", type=float, default=WATCH_MIN_INTERVAL,
+                              help=f"shortest interval for changing products (default: {WATCH_MIN_INTERVAL})")
+    watch_parser.add_argument("--max-interval", type=float, default=WATCH_MAX_INTERVAL,
+                              help=f"longest interval for stable products (default: {WATCH_MAX_INTERVAL})")
+    watch_parser.add_argument("--threshold", type=float, default=0.0,
+                              help="report drops of at least this many percent (default: 0)")
+    watch_parser.add_argument("--below", type=float, help="report prices falling to or below this USD value")
+    watch_parser.add_argument("--webhook", type=str, help="POST events as JSON to this url instead of printing them")
+    watch_parser.add_argument("--once", action="store_true", help="run a single polling cycle, e.g. from cron")
     return parser
 
 
@@ -19,6 +19,9 @@ setup(
         ]
     },
     python_requires=">=3.6",
+    extras_require={
+        "fast": ["orjson"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import gog_price_checker.__main__ as checker
+
+GOG_DATA = {
+    'products': [
+        {'id': 1207658930, 'title': 'Diablo', 'price': {'amount': '9.99', 'currency': 'USD'}},
+        {'id': 1, 'title': 'Brace };window.x = {"y": 1}; and quote \\" inside', 'price': '4.99 EUR'},
+        {'id': 2, 'title': 'Zażółć gęślą jaźń 日本語', 'price': {'amount': '12.00', 'currency': 'PLN'}},
+    ],
+}
+HTML = ("<html><head><script>var notGogData = 1; // gogData mentioned in a comment\n"
+        "window.gogData = " + json.dumps(GOG_DATA, ensure_ascii=False) + ";\n"
+        "    window.activeFeatures = [];</script></head><body>" + "<div>filler</div>" * 50 + "</body></html>")
+
+
+def chunked(data, *cuts):
+    bounds = [0, *cuts, len(data)]
+    return [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def test_extract_gog_data():
+    assert checker.extract_gog_data(HTML) == GOG_DATA
+
+
+@pytest.mark.parametrize('encode', [False, True], ids=['str', 'bytes'])
+def test_markers_split_across_two_chunks(encode):
+    data = HTML.encode('utf-8') if encode else HTML
+    for cut in range(1, len(data)):
+        assert checker.extract_gog_data_stream(chunked(data, cut)) == GOG_DATA, cut
+
+
+def test_one_character_chunks():
+    assert checker.extract_gog_data_stream(list(HTML)) == GOG_DATA
+
+
+def test_stops_reading_after_the_object():
+    consumed = []
+
+    def chunks():
+        for chunk in chunked(HTML, *range(64, len(HTML), 64)):
+            consumed.append(chunk)
+            yield chunk
+
+    assert checker.extract_gog_data_stream(chunks()) == GOG_DATA
+    assert sum(map(len, consumed)) < len(HTML)
+
+
+def test_missing_gog_data():
+    assert checker.extract_gog_data("<html><script>window.other = {};</script></html>") is None
@@ -0,0 +1,90 @@
+import multiprocessing
+from array import array
+
+import pytest
+
+import gog_price_checker.__main__ as checker
+
+
+def price(code, currency, value, value_usd=None):
+    result = checker.Price(code, code)
+    result.currency, result.value, result.value_usd = currency, value, value_usd
+    return result
+
+
+def test_append_and_rows(tmp_path):
+    history = checker.PriceHistory(str(tmp_path))
+    history.append('42', [price('DE', 'EUR', 10.0, 11.0), price('US', 'USD', 12.0, 12.0),
+                          checker.Price('PL', 'Poland')], timestamp=100.0)
+    history.append('43', [price('DE', 'EUR', 5.0)], timestamp=200.0)
+
+    assert len(history) == 3
+    assert list(history.rows()) == [
+        (100.0, 42, 'DE', 'EUR', 10.0, 11.0),
+        (100.0, 42, 'US', 'USD', 12.0, 12.0),
+        (200.0, 43, 'DE', 'EUR', 5.0, None),
+    ]
+    assert [row[1:3] for row in history.rows(product_id='42')] == [(42, 'DE'), (42, 'US')]
+    assert [row[1:3] for row in history.rows(country_code='DE')] == [(42, 'DE'), (43, 'DE')]
+    assert [row[1] for row in history.rows(since=150.0)] == [43]
+
+
+def test_rows_survive_reopening(tmp_path):
+    checker.PriceHistory(str(tmp_path)).append('42', [price('DE', 'EUR', 10.0)], timestamp=100.0)
+    assert list(checker.PriceHistory(str(tmp_path)).rows()) == [(100.0, 42, 'DE', 'EUR', 10.0, None)]
+
+
+def test_append_after_torn_write(tmp_path):
+    history = checker.PriceHistory(str(tmp_path))
+    history.append('42', [price('DE', 'EUR', 10.0)], timestamp=100.0)
+    # A write interrupted after the value column
+    with open(tmp_path / 'value', 'ab') as f:
+        array('d', [999.0]).tofile(f)
+    assert len(history) == 1
+
+    history.append('42', [price('FR', 'EUR', 20.0)], timestamp=200.0)
+    assert list(history.rows()) == [
+        (100.0, 42, 'DE', 'EUR', 10.0, None),
+        (200.0, 42, 'FR', 'EUR', 20.0, None),
+    ]
+    assert [row[2] for row in history.rows(country_code='FR')] == ['FR']
+
+
+def test_instances_sharing_a_directory(tmp_path):
+    first = checker.PriceHistory(str(tmp_path))
+    second = checker.PriceHistory(str(tmp_path))
+    first.append('42', [price('DE', 'EUR', 10.0)], timestamp=100.0)
+    second.append('42', [price('PL', 'PLN', 40.0)], timestamp=200.0)
+    first.append('42', [price('FR', 'EUR', 20.0), price('GB', 'GBP', 30.0)], timestamp=300.0)
+    expected = [
+        (100.0, 42, 'DE', 'EUR', 10.0, None),
+        (200.0, 42, 'PL', 'PLN', 40.0, None),
+        (300.0, 42, 'FR', 'EUR', 20.0, None),
+        (300.0, 42, 'GB', 'GBP', 30.0, None),
+    ]
+    assert list(first.rows()) == expected
+    assert list(second.rows()) == expected
+
+
+def append_rows(path, worker):
+    history = checker.PriceHistory(path)
+    for i in range(50):
+        # Every worker adds its own countries and currencies to the dictionaries
+        history.append(str(worker), [price(f"C{worker}{i % 5}", f"X{worker}{i % 3}", float(worker * 1000 + i))])
+
+
+@pytest.mark.skipif(checker.fcntl is None, reason="needs fcntl")
+def test_concurrent_processes(tmp_path):
+    processes = [multiprocessing.Process(target=append_rows, args=(str(tmp_path), worker))
+                 for worker in range(1, 5)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    rows = list(checker.PriceHistory(str(tmp_path)).rows())
+    assert len(rows) == 200
+    for _, product_id, country, currency, value, _ in rows:
+        i = int(value) - product_id * 1000
+        assert (country, currency) == (f"C{product_id}{i % 5}", f"X{product_id}{i % 3}")
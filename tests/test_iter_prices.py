@@ -0,0 +1,99 @@
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import gog_price_checker.__main__ as checker
+
+COUNTRIES = ['US', 'PL', 'DE', 'FR']
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # country code -> 'fail' (503) or 'slow' (answers after a second)
+    behaviour = {}
+
+    def handle_error(self, request, client_address):
+        # Requests cut off by the deadline drop their connection
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class PriceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        country_code = parse_qs(urlsplit(self.path).query)['countryCode'][0]
+        behaviour = self.server.behaviour.get(country_code)
+        if behaviour == 'slow':
+            time.sleep(1)
+        if behaviour == 'fail':
+            status, body = 503, b'{}'
+        else:
+            status = 200
+            body = json.dumps({'_embedded': {'prices': [
+                {'currency': {'code': 'USD'}, 'finalPrice': '999 USD'}]}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StandIn(('127.0.0.1', 0), PriceHandler)
+    server.behaviour = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    checker.set_transport(checker.Transport(host_map={'api.gog.com': f"http://127.0.0.1:{server.server_port}"},
+                                            limiter=checker.RateLimiter(100000), retries=0))
+    checker.set_fx(checker.FxRates({}))
+    checker.set_cache(None)
+    checker.set_history(None)
+    yield server
+    checker.set_regions(None)
+    checker.set_fx(None)
+    checker.set_transport(None)
+    server.shutdown()
+    server.server_close()
+
+
+def check(deadline=None):
+    with checker.FetchEngine(8, 8) as engine:
+        return {price.country_code: price
+                for price in checker.fetch_prices(['42'], COUNTRIES, engine, deadline=deadline)['42']}
+
+
+def test_failed_requests_are_logged(server, caplog):
+    server.behaviour = {code: 'fail' for code in COUNTRIES}
+    with caplog.at_level(logging.ERROR):
+        prices = check()
+    assert all(price.value is None for price in prices.values())
+    assert 'Error requesting price for product 42' in caplog.text
+
+
+def test_unanswered_countries_are_missing_after_the_deadline(server):
+    server.behaviour = {'US': 'slow', 'DE': 'slow'}
+    started = time.monotonic()
+    prices = check(deadline=0.3)
+    assert time.monotonic() - started < 1
+    assert prices['US'].missing and prices['DE'].missing
+    assert not prices['PL'].missing and prices['PL'].value == 9.99
+
+
+def test_failed_countries_are_not_learned(server):
+    server.behaviour = {'DE': 'fail'}
+    regions = checker.PriceRegions(min_samples=2)
+    checker.set_regions(regions)
+    check()
+    assert regions.samples == 1
+    assert 'DE' not in regions.region
+    assert [sorted(members) for members in regions.regions()] == [['FR', 'PL', 'US']]
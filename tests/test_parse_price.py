@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+import gog_price_checker.__main__ as checker
+
+
+def reference_parse(body):
+    """The json.loads path parse_price_body has to agree with"""
+    prices = json.loads(body.decode('utf-8'))['_embedded']['prices']
+    if not prices:
+        return None, None, None
+    value_usd = None
+    for item in prices:
+        amount, currency = item['finalPrice'].split(' ')
+        if currency == 'USD':
+            value_usd = int(amount) / 100
+    amount, currency = prices[0]['finalPrice'].split(' ')
+    return int(amount) / 100, currency, value_usd
+
+
+def price(code, cents):
+    return {'currency': {'code': code}, 'basePrice': f"{cents * 2} {code}",
+            'finalPrice': f"{cents} {code}", 'bonusWalletFunds': f"0 {code}"}
+
+
+def response(*prices, **dumps):
+    return json.dumps({
+        '_links': {'self': {'href': 'https://api.gog.com/products/1207658930/prices?countryCode=PL'}},
+        '_embedded': {'prices': list(prices), 'product': {'id': 1207658930}},
+    }, **dumps).encode('utf-8')
+
+
+BODIES = {
+    'local and USD': response(price('PLN', 4499), price('USD', 1199)),
+    'USD only': response(price('USD', 1199)),
+    'free': response(price('EUR', 0), price('USD', 0)),
+    'indented': response(price('GBP', 899), price('USD', 1099), indent=2),
+    'spaced separators': response(price('EUR', 999), price('USD', 1099), separators=(' , ', ' : ')),
+    'not sold': response(),
+}
+
+
+@pytest.mark.parametrize('body', BODIES.values(), ids=list(BODIES))
+def test_parse_price_body_matches_json_loads(body):
+    assert checker.parse_price_body(body) == reference_parse(body)
+
+
+def test_parse_price_body_rejects_other_responses():
+    with pytest.raises(KeyError):
+        checker.parse_price_body(b'{"error": "not_found", "error_description": "Product not found"}')
+
+
+def test_price_fields_matches_json_loads():
+    body = BODIES['local and USD']
+    prices = json.loads(body)['_embedded']['prices']
+    assert checker.price_fields(prices) == reference_parse(body)
@@ -0,0 +1,86 @@
+import json
+
+import gog_price_checker.__main__ as checker
+
+COUNTRIES = [('A', 'Country A'), ('B', 'Country B'), ('C', 'Country C'), ('D', 'Country D')]
+
+
+def prices(**values):
+    """Price objects from A=('EUR', 10.0) style keyword arguments"""
+    result = []
+    for code, (currency, value) in values.items():
+        price = checker.Price(code, f"Country {code}")
+        price.currency, price.value = currency, value
+        result.append(price)
+    return result
+
+
+def learned(samples, min_samples=1, verify_every=25, path=None):
+    regions = checker.PriceRegions(path=path, min_samples=min_samples, verify_every=verify_every)
+    for sample in samples:
+        regions.learn(sample)
+    return regions
+
+
+def test_learn_groups_identical_prices():
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0), C=('USD', 12.0), D=('USD', 12.0))])
+    assert sorted(regions.regions()) == [['A', 'B'], ['C', 'D']]
+
+
+def test_learn_splits_diverging_countries():
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0), C=('USD', 12.0), D=('USD', 12.0)),
+                       prices(A=('EUR', 10.0), B=('EUR', 9.0), C=('USD', 12.0), D=('USD', 12.0))])
+    assert sorted(regions.regions()) == [['A'], ['B'], ['C', 'D']]
+
+
+def test_learn_keeps_failed_country_out_of_new_regions():
+    # C failed on the second product while B diverged: C must not end up copying B
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0), C=('USD', 12.0), D=('USD', 12.0)),
+                       prices(A=('EUR', 10.0), B=('EUR', 9.0), D=('USD', 12.0))])
+    region_of = {code: members for members in regions.regions() for code in members}
+    assert 'B' not in region_of['C']
+    assert region_of['B'] == ['B']
+
+
+def test_plan_queries_one_country_per_region():
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0), C=('USD', 12.0), D=('USD', 12.0))])
+    queried, copies = regions.plan(COUNTRIES)
+    assert queried == [('A', 'Country A'), ('C', 'Country C')]
+    assert copies == {'A': [('B', 'Country B')], 'C': [('D', 'Country D')]}
+
+
+def test_plan_queries_everything_while_learning():
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0))], min_samples=2)
+    assert regions.plan(COUNTRIES) == (COUNTRIES, None)
+
+
+def test_plan_verifies_every_nth_product():
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0))], verify_every=3)
+    plans = [regions.plan(COUNTRIES)[1] for _ in range(6)]
+    assert [copies is None for copies in plans] == [False, False, True, False, False, True]
+
+
+def test_verification_count_survives_restarts(tmp_path):
+    path = str(tmp_path / 'price_regions.json')
+    learned([prices(A=('EUR', 10.0), B=('EUR', 10.0))], path=path)
+    # One product per run, like repeated single game checks
+    verified = []
+    for _ in range(checker.REGION_VERIFY_EVERY):
+        regions = checker.PriceRegions.load(path)
+        regions.min_samples = 1
+        verified.append(regions.plan(COUNTRIES)[1] is None)
+        # main() saves the regions when a run ends
+        regions.save()
+    assert verified.count(True) == 1
+
+
+def test_plan_only_writes_on_verification(tmp_path):
+    path = tmp_path / 'price_regions.json'
+    regions = learned([prices(A=('EUR', 10.0), B=('EUR', 10.0))], path=str(path), verify_every=3)
+    saved = path.read_text()
+    regions.plan(COUNTRIES)
+    regions.plan(COUNTRIES)
+    assert path.read_text() == saved
+    regions.plan(COUNTRIES)
+    assert json.loads(path.read_text())['planned'] == 3
+    assert [child.name for child in tmp_path.iterdir()] == ['price_regions.json']
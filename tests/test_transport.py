@@ -0,0 +1,88 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.error import HTTPError
+
+import pytest
+
+import gog_price_checker.__main__ as checker
+
+REDIRECTS = {
+    '/game/diablo': '/en/game/diablo',
+    '/loop': '/loop',
+    '/other-scheme': 'ftp://www.gog.com/en/game/diablo',
+}
+PAGE = b'<html><div card-product="1207658930"></div></html>'
+
+
+class RedirectingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        location = REDIRECTS.get(self.path)
+        if location:
+            self.send_response(301)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def transport():
+    server = HTTPServer(('127.0.0.1', 0), RedirectingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    transport = checker.Transport(host_map={'www.gog.com': f"http://127.0.0.1:{server.server_port}"},
+                                  retries=0)
+    checker.set_transport(transport)
+    yield transport
+    checker.set_transport(None)
+    server.shutdown()
+    server.server_close()
+
+
+def test_request_follows_redirects(transport):
+    response = transport.request('https://www.gog.com/game/diablo')
+    assert response.url == 'https://www.gog.com/en/game/diablo'
+    assert response.body == PAGE
+    assert checker.extract_product_id('https://www.gog.com/game/diablo') == '1207658930'
+
+
+def test_stream_follows_redirects(transport):
+    with transport.stream('https://www.gog.com/game/diablo') as chunks:
+        assert b''.join(chunks) == PAGE
+
+
+def test_redirect_loop_is_limited(transport):
+    with pytest.raises(HTTPError, match='redirects'):
+        transport.request('https://www.gog.com/loop')
+
+
+def test_redirect_to_another_scheme_is_refused(transport):
+    with pytest.raises(HTTPError, match='scheme'):
+        transport.request('https://www.gog.com/other-scheme')
+
+
+def test_limiter_gives_up_at_the_deadline():
+    limiter = checker.RateLimiter(rate=1, burst=1)
+    assert limiter.acquire()
+    started = time.monotonic()
+    assert not limiter.acquire(deadline=started + 0.2)
+    assert time.monotonic() - started < 0.5
+
+
+def test_request_waiting_for_the_limiter_stops_at_the_deadline(transport):
+    # One slot in flight and no tokens left, like after a 429 halved everything
+    transport.limiter = checker.RateLimiter(rate=1, burst=1, max_inflight=1)
+    transport.limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(checker.DeadlineExceeded):
+        transport.request('https://www.gog.com/en/game/diablo', deadline=started + 0.2)
+    assert time.monotonic() - started < 0.5